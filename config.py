@@ -6,6 +6,9 @@ BASE_DIR = Path(__file__).parent
 # Path to the teaching INI file (tab-delimited)
 TEACHING_INI = BASE_DIR / 'Model File' / 'SKU List.ini'
 
+# Binary snapshot of the parsed SKU list (rebuilt when the INI mtime/size changes)
+SKU_CATALOG_CACHE = BASE_DIR / 'Model File' / '.sku_catalog.cache'
+
 # Path to SKU variants JSON
 SKU_VARIANTS_PATH = BASE_DIR / 'Model File' / 'sku_variants.json'
 
@@ -24,3 +27,93 @@ YOLO2_MODEL_PATH = BASE_DIR / 'YOLO' / 'yolo_field_detector.pt'
 
 # EasyOCR custom model folder (set this for offline mode)
 EASYOCR_MODEL_DIR = BASE_DIR / '.EasyOCR' / 'model'
+
+# Local inference service (one warm model set shared by several stations).
+# Set USE_INFERENCE_SERVICE = True on the stations that should act as thin clients.
+USE_INFERENCE_SERVICE = False
+INFERENCE_SERVICE_HOST = '127.0.0.1'
+INFERENCE_SERVICE_PORT = 8765
+INFERENCE_SERVICE_TIMEOUT = 120.0
+# How often (seconds) a thin client checks whether to forward a cancellation to the service
+INFERENCE_CANCEL_POLL = 0.1
+# Requests are dispatched as they arrive, at most this many at once; the concurrent
+# detector calls they make are batched by micro_batch.py
+INFERENCE_MAX_CONCURRENT = 4
+
+# Crop buffer arenas (crop_arena.py) kept in memory, one per recently used SKU
+CROP_ARENA_MAX_SKUS = 4
+
+# Canonical field-crop height (px) before OCR, per field type (YOLO2 class, upper-case)
+FIELD_CANONICAL_HEIGHT = {'BASIC MODEL': 48, 'CAPACITY': 48, 'COLOR': 48, 'EAN': 64}
+FIELD_CANONICAL_HEIGHT_DEFAULT = 48
+# Width cap after rescaling, keeps OCR cost bounded for very long crops
+FIELD_MAX_WIDTH = 640
+# Crops below SMALL_CROP_RATIO * canonical height are counted as small (upscaled);
+# crops above OVERSIZED_CROP_RATIO * canonical height (or wider than the cap) as oversized
+SMALL_CROP_RATIO = 0.75
+OVERSIZED_CROP_RATIO = 2.0
+
+# Hot reload of YOLO weights, SKU List.ini and sku_variants.json
+HOT_RELOAD_ENABLED = True
+# Seconds without further file events before a reload starts (weights copies emit many events)
+HOT_RELOAD_DEBOUNCE = 2.0
+
+# NG crop retention: crops above this many resident bytes spill to disk (PNG)
+NG_CROP_POOL_BYTES = 64 * 1024 * 1024
+NG_CROP_SPILL_DIR = BASE_DIR / 'logs' / '.ng_spill'
+# Size (w, h) of the annotated preview handed to the GUI on every label update
+PREVIEW_SIZE = (600, 500)
+
+# Opt-in for replay.py: keep a copy of every original image in logs/<base>/ (written in the
+# background); the oldest copies are deleted once they exceed ARCHIVE_QUOTA_BYTES
+ARCHIVE_ORIGINALS = False
+ARCHIVE_QUOTA_BYTES = 2 * 1024 * 1024 * 1024
+# Replay mode (replay.py): on-disk cache of YOLO1/YOLO2/OCR stages and process pool size
+STAGE_CACHE_DIR = BASE_DIR / 'cache' / 'stages'
+REPLAY_WORKERS = 4
+
+# Station scheduler (scheduler.py): cycle-time deadline per image (seconds) and
+# whether a newer tray image supersedes (cancels) the one still being processed
+CYCLE_TIME_DEADLINE = 10.0
+SUPERSEDE_OLDER_IMAGES = True
+# Also cancel an image once its deadline has passed (otherwise it is only counted)
+CANCEL_ON_DEADLINE = False
+
+# Pipeline profiling (profiling.py). Explicit capture: PROFILE_ENABLED, env var, or the GUI
+# debug-mode toggle. Automatic capture: any image slower than PROFILE_SLO_SECONDS, which is the
+# station cycle-time deadline (None disables it and its background sampler).
+PROFILE_ENABLED = False
+PROFILE_ENV_VAR = 'LABELCHECK_PROFILE'
+PROFILE_SLO_SECONDS = CYCLE_TIME_DEADLINE
+PROFILE_SAMPLE_INTERVAL = 0.005
+PROFILE_SLO_SAMPLE_INTERVAL = 0.05
+PROFILE_QUOTA_BYTES = 50 * 1024 * 1024
+
+# Logging (log_setup.py): JSON records written by a background thread, with rotation
+LOG_FILE = 'label_app.log'
+# One writer per file: the inference service and replay runs log to their own files,
+# replay worker processes send their records to the parent process
+LOG_FILE_SERVICE = 'label_app.service.log'
+LOG_FILE_REPLAY = 'label_app.replay.log'
+LOG_MAX_BYTES = 10 * 1024 * 1024
+LOG_BACKUP_COUNT = 5
+LOG_LEVEL = 'INFO'
+LOG_CONSOLE_LEVEL = 'INFO'
+# Per-module levels, e.g. {'ocr_utils': 'DEBUG'} to see every EasyOCR result
+LOG_LEVELS = {'ocr_utils': 'INFO', 'ultralytics': 'WARNING', 'PIL': 'WARNING'}
+# Keep 1 out of every N DEBUG records per logger
+LOG_DEBUG_SAMPLE_EVERY = 10
+# Records are dropped (never blocking the pipeline) when this many are pending
+LOG_QUEUE_SIZE = 10000
+
+# Micro-batching of detector inference (micro_batch.py): concurrent predict calls arriving
+# within MICRO_BATCH_WINDOW seconds (up to MICRO_BATCH_MAX) share one batched forward pass.
+# Only useful where callers run concurrently: off on the stations (the scheduler runs one
+# image at a time), on for YOLO1 in the inference service. 'yolo2' can be added too; its
+# crops differ in size and are letterboxed to a square input.
+MICRO_BATCH_MODELS = ()
+INFERENCE_MICRO_BATCH_MODELS = ('yolo1',)
+MICRO_BATCH_WINDOW = 0.01
+MICRO_BATCH_MAX = 8
+# Log batch-size / wait-time stats every N batches
+MICRO_BATCH_LOG_EVERY = 50
@@ -0,0 +1,135 @@
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import cv2
+import numpy as np
+
+import config
+
+# Arena de buffers pré-alocados para os recortes do loop quente (label -> campos).
+# Cada SKU tem um pequeno pool de conjuntos de buffers; handle_label pega um conjunto
+# emprestado (checkout) e o devolve no fim, então os buffers sobrevivem ao
+# ThreadPoolExecutor de cada imagem. Um conjunto novo já nasce do tamanho do maior
+# recorte visto para o SKU, e depois do aquecimento não há novas alocações.
+
+GROWTH_HEADROOM = 1.25
+
+class ArenaStats:
+    """Contadores por imagem: alocações de buffer e bytes alocados / reutilizados."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.allocations = 0
+        self.bytes_allocated = 0
+        self.bytes_reused = 0
+
+    def record(self, allocated, nbytes):
+        with self._lock:
+            if allocated:
+                self.allocations += 1
+                self.bytes_allocated += nbytes
+            else:
+                self.bytes_reused += nbytes
+
+    def __str__(self):
+        return (f"allocations={self.allocations} | bytes_allocated={self.bytes_allocated} | "
+                f"bytes_reused={self.bytes_reused}")
+
+
+class CropBuffers:
+    """Buffers contíguos de um worker: label rotacionada, campo BGR e campo RGB."""
+
+    def __init__(self, high_water=None):
+        self._bufs = {}
+        # Maior tamanho (bytes) pedido por buffer, compartilhado pelos conjuntos do mesmo SKU
+        self._high_water = {} if high_water is None else high_water
+
+    def _view(self, name, shape, stats=None):
+        nbytes = int(np.prod(shape))
+        if nbytes == 0:
+            raise ValueError(f"Empty crop for buffer '{name}' (shape {tuple(shape)})")
+        if nbytes > self._high_water.get(name, 0):
+            self._high_water[name] = nbytes
+        buf = self._bufs.get(name)
+        allocated = buf is None or buf.size < nbytes
+        if allocated:
+            # Folga para a variação de poucos pixels das caixas do YOLO não realocar de novo
+            buf = np.empty(int(self._high_water[name] * GROWTH_HEADROOM), dtype=np.uint8)
+            self._bufs[name] = buf
+        if stats is not None:
+            # Na alocação conta o buffer inteiro (com a folga), não só o recorte pedido
+            stats.record(allocated, buf.nbytes if allocated else nbytes)
+        return buf[:nbytes].reshape(shape)
+
+    def label_roi(self, img, coords, stats=None):
+        """Recorta a label e rotaciona 90° (horário) direto no buffer."""
+        x1, y1, x2, y2 = coords
+        crop = img[y1:y2, x1:x2]
+        h, w = crop.shape[:2]
+        dst = self._view('label', (w, h) + crop.shape[2:], stats)
+        return cv2.rotate(crop, cv2.ROTATE_90_CLOCKWISE, dst=dst)
+
+    def field_bgr(self, src, stats=None):
+        """Cópia contígua do campo (BGR), usada pelo leitor de código de barras."""
+        dst = self._view('field_bgr', src.shape, stats)
+        np.copyto(dst, src)
+        return dst
+
+    def field_rgb(self, src, stats=None, size=None):
+        """
+        Cópia contígua do campo já convertida para RGB (entrada do EasyOCR).
+        Se size=(w, h) for informado, o recorte é redimensionado direto no buffer.
+        """
+        if size is None or size == (src.shape[1], src.shape[0]):
+            dst = self._view('field_rgb', src.shape, stats)
+            if src.ndim == 3 and src.shape[2] == 3:
+                return cv2.cvtColor(src, cv2.COLOR_BGR2RGB, dst=dst)
+            np.copyto(dst, src)
+            return dst
+        w, h = size
+        dst = self._view('field_rgb', (h, w) + src.shape[2:], stats)
+        interp = cv2.INTER_AREA if h < src.shape[0] else cv2.INTER_CUBIC
+        dst = cv2.resize(src, (w, h), dst=dst, interpolation=interp)
+        if dst.ndim == 3 and dst.shape[2] == 3:
+            dst = cv2.cvtColor(dst, cv2.COLOR_BGR2RGB, dst=dst)
+        return dst
+
+
+class CropArena:
+    """Pool de CropBuffers de um SKU, emprestados a cada label."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._free = []
+        self._high_water = {}
+
+    @contextmanager
+    def checkout(self):
+        with self._lock:
+            bufs = self._free.pop() if self._free else CropBuffers(self._high_water)
+        try:
+            yield bufs
+        finally:
+            with self._lock:
+                self._free.append(bufs)
+
+
+_arenas = OrderedDict()
+_arenas_lock = threading.Lock()
+
+
+def get_arena(sku):
+    """
+    Uma arena por SKU, pois o tamanho das labels/campos depende do layout do SKU.
+    Só as CROP_ARENA_MAX_SKUS mais recentes ficam em memória.
+    """
+    with _arenas_lock:
+        arena = _arenas.get(sku)
+        if arena is None:
+            arena = _arenas[sku] = CropArena()
+            while len(_arenas) > config.CROP_ARENA_MAX_SKUS:
+                _arenas.popitem(last=False)
+        else:
+            _arenas.move_to_end(sku)
+        return arena
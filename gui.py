@@ -1,6 +1,5 @@
 import tkinter as tk
 from tkinter import ttk, messagebox
-import csv
 import time
 import cv2
 import logging
@@ -15,6 +14,12 @@ from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
 from datetime import datetime
 import gmes_check
+import sku_catalog
+import profiling
+import log_setup
+from overlay import OverlayCompositor
+from scheduler import StationScheduler, PipelineCancelled, checkpoint, STATUS_SUPERSEDED, STATUS_CANCELLED
+from inference_service import InferenceClient
 
 class NewImageHandler(FileSystemEventHandler):
     def __init__(self, callback):
@@ -39,11 +44,24 @@ class LabelCheckApp:
         root.grid_columnconfigure(2, weight=1)
         root.grid_rowconfigure(1, weight=1)
         self.stop_event = threading.Event()
+        # Uma imagem por vez, sempre a mais nova; imagens antigas ficam 'superseded'
+        self.scheduler = StationScheduler(self._process_image, station_stop=self.stop_event,
+                                          on_finished=self._on_image_finished)
         self.debug_mode = False
         root.protocol('WM_DELETE_WINDOW', self._on_close)
         self.progress_queue = queue.Queue()
         self._build_ui()
         self._load_teaching_file()
+        # Em modo serviço a estação é um cliente fino: os modelos ficam no inference_service
+        self.inference_client = InferenceClient() if config.USE_INFERENCE_SERVICE else None
+        if self.inference_client is None:
+            main.load_models()
+        elif not self.inference_client.health():
+            logging.warning("Inference service not reachable at %s:%d",
+                            config.INFERENCE_SERVICE_HOST, config.INFERENCE_SERVICE_PORT)
+        if config.HOT_RELOAD_ENABLED:
+            main.registry.subscribe(self._on_reload)
+            main.registry.start_watching()
         self.observer = None
         self._check_progress()
         self.last_summary = "Summary: Total Labels: 0 | Total fails: 0 | Fail rate: 0.0%"
@@ -62,6 +80,12 @@ class LabelCheckApp:
         self.debug_btn = tk.Button(self.root, text='DEBUG', state='normal', bg='gray', command=self.toggle_debug)
         self.debug_btn.grid(row=1, column=1, columnspan=1, pady=15, sticky='w')
 
+        # Profiling por imagem (disponível só no modo debug)
+        self.profile_var = tk.BooleanVar(value=False)
+        self.profile_chk = tk.Checkbutton(self.root, text='PROFILE', variable=self.profile_var, bg='light gray',
+                                          state='disabled', command=self.toggle_profile)
+        self.profile_chk.grid(row=1, column=1, columnspan=1, pady=15, padx=(90, 0), sticky='w')
+
         tk.Label(self.root, text='Model Spec:', bg='light gray').grid(row=2, column=0, sticky='we', padx=5)
         self.spec_table = ttk.Treeview(self.root, columns=('Field', 'Value'), show='headings', height=5)
         self.spec_table.heading('Field', text='Field')
@@ -88,16 +112,38 @@ class LabelCheckApp:
         self.canvas.grid(row=1, column=2, rowspan=5, padx=10, pady=5, sticky='nsew')
 
     def _load_teaching_file(self):
-        self.sku_data = {}
+        if getattr(self, 'catalog', None) is None:
+            # Catálogo vazio se o INI não carregar: Start avisa "SKU não encontrado" em vez de quebrar
+            self.catalog = sku_catalog.SkuCatalog()
         try:
-            with open(config.TEACHING_INI, newline='', encoding='utf-8') as f:
-                reader = csv.DictReader(f, delimiter='\t')
-                for row in reader:
-                    sku = row['SKU'].strip()
-                    self.sku_data[sku] = {k.strip(): v.strip() for k, v in row.items()}
+            self.catalog = sku_catalog.get_catalog()
+            self.catalog.reload_if_changed()
         except Exception as e:
             messagebox.showerror("Error", f"Failed loading SKU list: {e}")
 
+    def _on_reload(self, kind):
+        # Chamado pela thread do hot reload; o Tk só pode ser tocado na thread principal
+        if kind == 'sku_list':
+            self.root.after(0, self._reload_sku_list)
+
+    def _reload_sku_list(self):
+        self._load_teaching_file()
+        current = getattr(self, 'sku_info', None)
+        if current is None:
+            return
+        # A estação em andamento passa a validar contra a linha nova do SKU
+        record = self.catalog.get(current.sku)
+        if record is None:
+            logging.warning(f"SKU '{current.sku}' removed from SKU List.ini; keeping previous spec")
+            return
+        self.sku_info = record
+        if self.start_btn['text'] == 'Stop':
+            self._show_spec()
+
+    def _show_spec(self):
+        for fld in self.default_fields:
+            self.spec_table.item(fld, values=(fld, self.sku_info.get(fld, '-')))
+
     def toggle_start(self):
         if self.start_btn['text'] == 'Start':
             self.start_btn.config(text='Stop', bg='yellow')
@@ -119,15 +165,14 @@ class LabelCheckApp:
 
             self.sku_shown_var.set(f"SKU: {sku_found}")
 
-            self.sku_info = self.sku_data.get(sku_found)
+            self.sku_info = self.catalog.get(sku_found)
             if not self.sku_info:
                 self.root.after(0, lambda: messagebox.showerror("Erro",
                                                                 f"SKU '{sku_found}' não encontrado no SKU List.ini"))
                 return
 
             # Atualiza tabela com info do SKU
-            for fld in self.default_fields:
-                self.spec_table.item(fld, values=(fld, self.sku_info.get(fld, '-')))
+            self._show_spec()
         else:
             self._stop()
 
@@ -155,8 +200,14 @@ class LabelCheckApp:
         elif 'STOP' in self.debug_btn['text']:
             self.debug_mode = False
             self.debug_btn.config(text='DEBUG', bg='gray')
+            self.profile_var.set(False)
+            self.profile_chk.config(state='disabled')
+            profiling.set_enabled(False)
             messagebox.showinfo("Debug", "Modo debug desativado.")
 
+    def toggle_profile(self):
+        profiling.set_enabled(self.profile_var.get())
+
     def show_password_popup(self):
         popup = tk.Toplevel(self.root)
         popup.title("Password")
@@ -173,6 +224,9 @@ class LabelCheckApp:
             if pwd == "Seda2025":
                 self.debug_mode = True
                 self.debug_btn.config(text="STOP DEBUG", bg="yellow")
+                # No modo thin-client o pipeline roda no serviço; o profiling é ligado lá
+                if self.inference_client is None:
+                    self.profile_chk.config(state='normal')
                 popup.destroy()
                 messagebox.showinfo("Debug", "Modo debug ativado.\nAuto-aprendizado habilitado!")
             else:
@@ -184,6 +238,7 @@ class LabelCheckApp:
 
     def _on_close(self):
         self._stop()
+        main.registry.stop_watching()
         self.root.destroy()
 
     def _check_progress(self):
@@ -196,52 +251,44 @@ class LabelCheckApp:
         self.root.after(50, self._check_progress)
 
     def _on_new_image(self, path):
-        def task():
-            import time
-            import cv2
-            self.progress['value'] = 0
-
-            # Só processa se o nome da imagem tiver 'img_code'
-            if 'img_code' not in str(path).lower():
-                print(f"Ignorado: {path.name}")
-                return
+        # Só processa se o nome da imagem tiver 'img_code'
+        if 'img_code' not in str(path).lower():
+            print(f"Ignorado: {path.name}")
+            return
+        self.scheduler.submit(path)
+
+    def _on_image_finished(self, job):
+        if job.status in (STATUS_SUPERSEDED, STATUS_CANCELLED):
+            c = dict(self.scheduler.counters)
+            self.root.after(0, lambda: [
+                self.progress.stop(),
+                self.test_time_var.set(f"Test-time: {job.status} | superseded: {c[STATUS_SUPERSEDED]} | "
+                                       f"missed deadline: {c['missed_deadline']}")
+            ])
+
+    def _process_image(self, path, token):
+        import time
+        import cv2
+        self.progress['value'] = 0
+        self.progress.start(10)
+        img0 = None
+        for _ in range(10):
+            checkpoint(token)
+            try:
+                img0 = cv2.imread(str(path))
+                if img0 is not None:
+                    break
+            except PermissionError:
+                time.sleep(0.2)
+
+        self.root.after(0, lambda: self.progress.config(maximum=100))
+        start = time.time()
 
-            self.progress.start(10)
-            img0 = None
-            for _ in range(10):
-                if self.stop_event.is_set():
-                    return
-                try:
-                    img0 = cv2.imread(str(path))
-                    if img0 is not None:
-                        break
-                except PermissionError:
-                    time.sleep(0.2)
-
-            quick_count = 0
-            if img0 is not None:
-                try:
-                    quick_count = len(main.yolo1.predict(img0)[0].boxes)
-                except Exception as e:
-                    logging.error(f"Quick count prediction failed: {e}")
-                    quick_count = 20  # fallback
-
-            self.root.after(0, lambda: self.progress.config(maximum=100))
-            start = time.time()
-
-            # Quick annotation inicial
+        # Quick annotation inicial (somente com modelos locais): mesma ordem/numeração do pipeline
+        if img0 is not None and self.inference_client is None:
             try:
-                img_q = cv2.imread(str(path))
-                if img_q is None:
-                    raise ValueError("Failed to load image for quick annotation")
-                res_q = main.yolo1.predict(img_q)[0]
-                ann_q = img_q.copy()
-                for idx_q, box_q in enumerate(res_q.boxes):
-                    x1, y1, x2, y2 = map(int, box_q.xyxy[0])
-                    cv2.rectangle(ann_q, (x1, y1), (x2, y2), (255, 0, 0), 2)
-                    cv2.putText(ann_q, f"{idx_q + 1:02d}", (x1 + 5, y2 - 5),
-                                cv2.FONT_HERSHEY_SIMPLEX, 0.8, (255, 0, 0), 2)
-                rgb_q = cv2.cvtColor(ann_q, cv2.COLOR_BGR2RGB)
+                boxes_q = main.detect_labels(main.load_models().yolo1, img0)
+                rgb_q = cv2.cvtColor(OverlayCompositor(img0, boxes_q).preview(), cv2.COLOR_BGR2RGB)
                 pil_q = Image.fromarray(rgb_q).resize((600, 500), resample=Image.LANCZOS)
                 photo_q = ImageTk.PhotoImage(pil_q)
                 self.root.after(0, lambda: [
@@ -252,69 +299,75 @@ class LabelCheckApp:
             except Exception:
                 logging.exception("Label task exception during quick annotation")
 
-            # Callback para atualizar canvas a cada label processada
-            def gui_update_fn(annot_img):
-                rgb = cv2.cvtColor(annot_img, cv2.COLOR_BGR2RGB)
-                pil = Image.fromarray(rgb).resize((600, 500), resample=Image.LANCZOS)
-                photo = ImageTk.PhotoImage(pil)
-                self.root.after(0, lambda: [
-                    self.canvas.delete('all'),
-                    self.canvas.create_image(0, 0, anchor='nw', image=photo),
-                    setattr(self.canvas, 'image', photo)
-                ])
-
-            # Progresso proporcional a labels processadas
-            def step_cb(current_idx, total_labels):
-                pct = int((current_idx / total_labels) * 100)
-                self.progress_queue.put(pct)
-
-            try:
-                annotated, count, ng_labels, all_label_results = main.process_image_pipeline(
-                    str(path),
-                    self.sku_info,
-                    progress_callback=step_cb,
-                    stop_event=self.stop_event,
-                    gui_update_fn=gui_update_fn,
-                    user_ip=self.get_ip_address()
-                )
-            except Exception as e:
-                logging.exception("Label task exception in full pipeline")
-                self.root.after(0, lambda: messagebox.showerror("Error", str(e)))
-                return
-
-            # Mostra popups NG/OK para autoaprendizagem somente se debug_mode ativo
-            if self.debug_mode:
-                for ng in ng_labels:
-                    self.show_label_ng_popup(ng["crop_img"], ng["logs"], ng["sku"], ng["label_num"])
-
-            rgb = cv2.cvtColor(annotated, cv2.COLOR_BGR2RGB)
+        # Callback para atualizar canvas a cada label processada
+        def gui_update_fn(annot_img):
+            rgb = cv2.cvtColor(annot_img, cv2.COLOR_BGR2RGB)
             pil = Image.fromarray(rgb).resize((600, 500), resample=Image.LANCZOS)
             photo = ImageTk.PhotoImage(pil)
-            elapsed = time.time() - start
-
-            def update():
-                self.canvas.delete('all')
-                self.canvas.create_image(0, 0, anchor='nw', image=photo)
-                self.canvas.image = photo
-                self.test_time_var.set(f"Test-time: {elapsed:.2f}s")
-                # Cálculo do resumo
-                total_labels = count
-                total_fails = 0
-                n_fields = 0
-                for logs in all_label_results:
-                    total_fails += sum(1 for v in logs.values() if not getattr(v, 'valid', False))
-                    n_fields = max(n_fields, len(logs))
-                fail_rate = 100 * total_fails / (total_labels * n_fields) if total_labels and n_fields else 0.0
-                self.summary_var.set(
-                    f"Summary: Total Labels: {total_labels} | Total fails: {total_fails} | Fail rate: {fail_rate:.1f}%")
-                self.summary_label.config(fg='red' if fail_rate >= 90 else 'blue')
-                self.progress['value'] = 100
-
-            self.root.after(0, update)
-            self.progress.stop()
+            self.root.after(0, lambda: [
+                self.canvas.delete('all'),
+                self.canvas.create_image(0, 0, anchor='nw', image=photo),
+                setattr(self.canvas, 'image', photo)
+            ])
+
+        # Progresso proporcional a labels processadas
+        def step_cb(current_idx, total_labels):
+            pct = int((current_idx / total_labels) * 100)
+            self.progress_queue.put(pct)
+
+        try:
+            pipeline = (self.inference_client.process_image_pipeline if self.inference_client
+                        else main.process_image_pipeline)
+            annotated, count, ng_labels, all_label_results = pipeline(
+                str(path),
+                self.sku_info,
+                progress_callback=step_cb,
+                stop_event=token,
+                gui_update_fn=gui_update_fn,
+                user_ip=self.get_ip_address()
+            )
+        except PipelineCancelled:
+            raise
+        except Exception as e:
+            # O scheduler registra o traceback e conta a imagem como 'failed'
+            msg = str(e)
+            self.root.after(0, lambda: [self.progress.stop(), messagebox.showerror("Error", msg)])
+            raise
+
+        # Mostra popups NG/OK para autoaprendizagem somente se debug_mode ativo
+        if self.debug_mode:
+            for ng in ng_labels:
+                self.show_label_ng_popup(ng["crop"].load(), ng["logs"], ng["sku"], ng["label_num"])
+        for ng in ng_labels:
+            ng["crop"].release()
+
+        rgb = cv2.cvtColor(annotated, cv2.COLOR_BGR2RGB)
+        pil = Image.fromarray(rgb).resize((600, 500), resample=Image.LANCZOS)
+        photo = ImageTk.PhotoImage(pil)
+        elapsed = time.time() - start
+
+        def update():
+            self.canvas.delete('all')
+            self.canvas.create_image(0, 0, anchor='nw', image=photo)
+            self.canvas.image = photo
+            self.test_time_var.set(f"Test-time: {elapsed:.2f}s")
+            # Cálculo do resumo
+            total_labels = count
+            total_fails = 0
+            n_fields = 0
+            for logs in all_label_results:
+                total_fails += sum(1 for v in logs.values() if not getattr(v, 'valid', False))
+                n_fields = max(n_fields, len(logs))
+            fail_rate = 100 * total_fails / (total_labels * n_fields) if total_labels and n_fields else 0.0
+            self.summary_var.set(
+                f"Summary: Total Labels: {total_labels} | Total fails: {total_fails} | Fail rate: {fail_rate:.1f}%")
+            self.summary_label.config(fg='red' if fail_rate >= 90 else 'blue')
             self.progress['value'] = 100
 
-        threading.Thread(target=task, daemon=True).start()
+        self.root.after(0, update)
+        self.progress.stop()
+        self.progress['value'] = 100
+
 
     def show_label_ng_popup(self, crop_img, logs, sku, label_num):
         win = tk.Toplevel()
@@ -370,6 +423,7 @@ class LabelCheckApp:
             return "127.0.0.1"
 
 if __name__ == '__main__':
+    log_setup.configure(config.LOG_FILE)
     root = tk.Tk()
     app = LabelCheckApp(root)
     root.mainloop()
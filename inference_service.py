@@ -0,0 +1,315 @@
+import base64
+import http.client
+import json
+import logging
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+import config
+import log_setup
+import sku_catalog
+import retention
+from scheduler import JobToken, PipelineCancelled, STATUS_CANCELLED, checkpoint
+from validation import ValidationResult
+
+# Serviço local de inferência: um único processo mantém YOLO1, YOLO2 e EasyOCR
+# carregados e atende várias estações (LabelCheckApp) via HTTP/JSON.
+
+
+def encode_image(img, ext='.png'):
+    success, buf = cv2.imencode(ext, img)
+    if not success:
+        raise ValueError("Failed to encode image")
+    return base64.b64encode(buf.tobytes()).decode('ascii')
+
+
+def decode_image(data):
+    arr = np.frombuffer(base64.b64decode(data), dtype=np.uint8)
+    img = cv2.imdecode(arr, cv2.IMREAD_COLOR)
+    if img is None:
+        raise ValueError("Failed to decode image")
+    return img
+
+
+def results_to_json(annotated, count, ng_labels, all_label_results):
+    return {
+        "annotated": encode_image(annotated, '.jpg'),
+        "count": count,
+        "ng_labels": [
+            {
+                "crop_img": encode_image(ng["crop"].load()),
+                "logs": {k: v.to_dict() for k, v in ng["logs"].items()},
+                "sku": ng["sku"],
+                "label_num": ng["label_num"],
+            }
+            for ng in ng_labels
+        ],
+        "all_label_results": [
+            {k: v.to_dict() for k, v in logs.items()} for logs in all_label_results
+        ],
+    }
+
+
+def results_from_json(payload):
+    all_label_results = [
+        {k: ValidationResult.from_dict(v) for k, v in logs.items()}
+        for logs in payload["all_label_results"]
+    ]
+    ng_labels = [
+        {
+            "crop": retention.get_pool().put(decode_image(ng["crop_img"])),
+            "logs": {k: ValidationResult.from_dict(v) for k, v in ng["logs"].items()},
+            "sku": ng["sku"],
+            "label_num": ng["label_num"],
+        }
+        for ng in payload["ng_labels"]
+    ]
+    return decode_image(payload["annotated"]), payload["count"], ng_labels, all_label_results
+
+
+class JobDispatcher:
+    """
+    Executa cada requisição assim que chega, com no máximo INFERENCE_MAX_CONCURRENT em
+    paralelo (as excedentes esperam na fila do executor). Não há barreira entre
+    requisições: uma imagem lenta não segura as das outras estações. O agrupamento em
+    lote fica na camada do modelo (micro_batch.MicroBatcher), onde as chamadas
+    concorrentes ao YOLO viram um único forward.
+    """
+
+    def __init__(self, handler, max_concurrent=config.INFERENCE_MAX_CONCURRENT):
+        self.handler = handler
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrent, thread_name_prefix='inference')
+
+    def submit(self, request, timeout=None, token=None):
+        fut = self._executor.submit(self._run_job, request, token)
+        try:
+            return fut.result(timeout)
+        except FutureTimeoutError:
+            if token is not None:
+                token.cancel('timeout')
+            raise TimeoutError("Inference request timed out")
+
+    def _run_job(self, request, token):
+        try:
+            return self.handler(request, token)
+        except PipelineCancelled as e:
+            return {"ok": False, "cancelled": e.reason, "error": f"cancelled: {e.reason}"}
+        except Exception as e:
+            logging.exception("Inference service request failed")
+            return {"ok": False, "error": str(e)}
+
+
+class InferenceService:
+    def __init__(self):
+        import main
+        self.main = main
+        # Aqui há chamadores concorrentes (várias estações): vale agrupar as chamadas ao YOLO
+        main.enable_micro_batching(config.INFERENCE_MICRO_BATCH_MODELS)
+        main.load_models()
+        self.catalog = sku_catalog.get_catalog()
+        if config.HOT_RELOAD_ENABLED:
+            main.registry.subscribe(self._on_reload)
+            main.registry.start_watching()
+        self.dispatcher = JobDispatcher(self.process)
+        # job_id -> JobToken das requisições em andamento (POST /cancel)
+        self._jobs = {}
+        self._jobs_lock = threading.Lock()
+
+    def _on_reload(self, kind):
+        if kind == 'sku_list':
+            self.catalog.reload_if_changed()
+
+    def submit(self, request, timeout=None):
+        """Registra o token da requisição antes de ela entrar na fila, para poder ser cancelada."""
+        token = JobToken()
+        job_id = request.get("job_id")
+        if job_id:
+            with self._jobs_lock:
+                self._jobs[job_id] = token
+        try:
+            return self.dispatcher.submit(request, timeout, token)
+        finally:
+            if job_id:
+                with self._jobs_lock:
+                    self._jobs.pop(job_id, None)
+
+    def cancel(self, job_id, reason=STATUS_CANCELLED):
+        with self._jobs_lock:
+            token = self._jobs.get(job_id)
+        if token is None:
+            return False
+        token.cancel(reason)
+        return True
+
+    def process(self, request, token=None):
+        # Pode ter sido cancelada enquanto esperava na fila
+        checkpoint(token)
+        sku_info = request.get("sku_info")
+        if sku_info is None:
+            sku = request.get("sku")
+            sku_info = self.catalog.get(sku)
+            if sku_info is None:
+                raise KeyError(f"SKU '{sku}' não encontrado no SKU List.ini")
+        user_ip = request.get("user_ip")
+        if request.get("image_b64"):
+            img = decode_image(request["image_b64"])
+            name = request.get("name") or "remote_image.png"
+            result = self.main.process_loaded_image(img, name, sku_info, stop_event=token, user_ip=user_ip)
+        else:
+            result = self.main.process_image_pipeline(request["image_path"], sku_info, stop_event=token,
+                                                      user_ip=user_ip)
+        response = results_to_json(*result)
+        response["ok"] = True
+        return response
+
+
+class _RequestHandler(BaseHTTPRequestHandler):
+    service = None
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == '/health':
+            self._send_json(200, {"ok": True})
+        else:
+            self._send_json(404, {"ok": False, "error": "not found"})
+
+    def do_POST(self):
+        if self.path not in ('/process', '/cancel'):
+            self._send_json(404, {"ok": False, "error": "not found"})
+            return
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            request = json.loads(self.rfile.read(length).decode('utf-8'))
+        except Exception as e:
+            self._send_json(400, {"ok": False, "error": f"invalid request: {e}"})
+            return
+        if self.path == '/cancel':
+            found = self.service.cancel(request.get("job_id"), request.get("reason") or STATUS_CANCELLED)
+            self._send_json(200, {"ok": True, "found": found})
+            return
+        try:
+            response = self.service.submit(request, timeout=config.INFERENCE_SERVICE_TIMEOUT)
+        except TimeoutError as e:
+            self._send_json(504, {"ok": False, "error": str(e)})
+            return
+        if response.get("ok"):
+            status = 200
+        else:
+            status = 409 if response.get("cancelled") else 500
+        self._send_json(status, response)
+
+    def log_message(self, format, *args):
+        logging.debug("Inference service: " + format, *args)
+
+
+def serve(host=config.INFERENCE_SERVICE_HOST, port=config.INFERENCE_SERVICE_PORT):
+    service = InferenceService()
+    handler = type('RequestHandler', (_RequestHandler,), {'service': service})
+    server = ThreadingHTTPServer((host, port), handler)
+    logging.info(f"Inference service listening on {host}:{port}")
+    return server
+
+
+class InferenceClient:
+    """Cliente fino: mesma assinatura e mesmo retorno de main.process_image_pipeline."""
+
+    def __init__(self, host=config.INFERENCE_SERVICE_HOST, port=config.INFERENCE_SERVICE_PORT,
+                 timeout=config.INFERENCE_SERVICE_TIMEOUT):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+
+    def _request(self, method, path, payload=None):
+        conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+        try:
+            body = json.dumps(payload).encode('utf-8') if payload is not None else None
+            headers = {'Content-Type': 'application/json'} if body is not None else {}
+            conn.request(method, path, body=body, headers=headers)
+            resp = conn.getresponse()
+            data = json.loads(resp.read().decode('utf-8'))
+        finally:
+            conn.close()
+        if data.get("cancelled"):
+            raise PipelineCancelled(data["cancelled"])
+        if not data.get("ok"):
+            raise RuntimeError(f"Inference service error: {data.get('error')}")
+        return data
+
+    def _forward_cancel(self, job_id, stop_event, done):
+        """Enquanto a requisição está em andamento, repassa o cancelamento local ao serviço."""
+        while not done.wait(config.INFERENCE_CANCEL_POLL):
+            if stop_event.is_set():
+                reason = getattr(stop_event, 'reason', None) or STATUS_CANCELLED
+                try:
+                    self._request('POST', '/cancel', {"job_id": job_id, "reason": reason})
+                except Exception:
+                    logging.exception("Failed forwarding cancellation to the inference service")
+                return
+
+    def health(self):
+        try:
+            return self._request('GET', '/health')["ok"]
+        except Exception:
+            return False
+
+    def process_image_pipeline(self, image_path, sku_info=None, progress_callback=None, stop_event=None,
+                               gui_update_fn=None, user_ip=None, send_image=False):
+        """
+        send_image=False envia apenas o caminho (mesma máquina / pasta compartilhada);
+        send_image=True envia os bytes da imagem.
+        """
+        record = sku_catalog.as_record(sku_info)
+        request = {"sku_info": record.as_dict() if record else None, "user_ip": user_ip}
+        if record:
+            request["sku"] = record.sku
+        if send_image:
+            request["image_b64"] = base64.b64encode(Path(image_path).read_bytes()).decode('ascii')
+            request["name"] = Path(image_path).name
+        else:
+            request["image_path"] = str(Path(image_path).resolve())
+        request["job_id"] = uuid.uuid4().hex
+        done = threading.Event()
+        if stop_event is not None:
+            threading.Thread(target=self._forward_cancel, args=(request["job_id"], stop_event, done),
+                             name='inference-cancel', daemon=True).start()
+        try:
+            payload = self._request('POST', '/process', request)
+        finally:
+            done.set()
+        checkpoint(stop_event)
+        annotated, count, ng_labels, all_label_results = results_from_json(payload)
+        if gui_update_fn:
+            gui_update_fn(annotated)
+        if progress_callback and count:
+            progress_callback(count, count)
+        return annotated, count, ng_labels, all_label_results
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Serviço local de inferência do Label Check")
+    parser.add_argument('--host', default=config.INFERENCE_SERVICE_HOST)
+    parser.add_argument('--port', type=int, default=config.INFERENCE_SERVICE_PORT)
+    args = parser.parse_args()
+    log_setup.configure(config.LOG_FILE_SERVICE)
+    server = serve(args.host, args.port)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
@@ -0,0 +1,218 @@
+import atexit
+import itertools
+import json
+import logging
+import logging.handlers
+import multiprocessing
+import queue
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime
+
+import config
+
+# Logging não bloqueante: as threads do pipeline só colocam o registro numa fila
+# (QueueHandler); uma thread QueueListener grava em disco (JSON, com rotação) e no console.
+# O contexto (imagem, label, campo) é anexado a cada registro via log_context().
+# Cada arquivo tem um único processo escritor: a GUI usa LOG_FILE, o serviço e o replay
+# usam arquivos próprios, e os processos filhos (workers do replay) não abrem arquivo,
+# mandam os registros para o processo pai (configure_worker / worker_logging).
+# configure() é chamado só pelos pontos de entrada (gui, inference_service, replay), nunca
+# no import, para que testes e ferramentas que importam main não criem arquivos de log.
+
+_context = threading.local()
+_listener = None
+_log_queue = None
+_log_file = None
+_worker = False
+_configure_lock = threading.Lock()
+
+
+def current_context():
+    return getattr(_context, 'fields', {})
+
+
+@contextmanager
+def log_context(**fields):
+    """Anexa campos (ex.: image=..., label=..., field=...) aos logs da thread atual."""
+    previous = current_context()
+    _context.fields = {**previous, **fields}
+    try:
+        yield
+    finally:
+        _context.fields = previous
+
+
+class ContextFilter(logging.Filter):
+    """Roda na thread que gerou o log, antes do registro entrar na fila."""
+
+    def filter(self, record):
+        # Registros vindos de um processo filho já trazem o contexto de lá
+        if not hasattr(record, 'ctx'):
+            record.ctx = current_context()
+        return True
+
+
+class DebugSamplingFilter(logging.Filter):
+    """Mantém 1 a cada N registros DEBUG por logger; demais níveis passam sempre."""
+
+    def __init__(self, every):
+        super().__init__()
+        self.every = max(1, int(every))
+        self._counters = defaultdict(itertools.count)
+
+    def filter(self, record):
+        if record.levelno > logging.DEBUG or self.every == 1:
+            return True
+        return next(self._counters[record.name]) % self.every == 0
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            "level": record.levelname,
+            "logger": record.name,
+            "thread": record.threadName,
+            "msg": record.getMessage(),
+        }
+        entry.update(getattr(record, 'ctx', {}))
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class ContextConsoleFormatter(logging.Formatter):
+    def formatMessage(self, record):
+        text = super().formatMessage(record)
+        ctx = getattr(record, 'ctx', None)
+        if ctx:
+            text += " [" + " ".join(f"{k}={v}" for k, v in ctx.items()) + "]"
+        return text
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """Nunca bloqueia quem loga: com a fila cheia o registro é descartado e contado."""
+
+    dropped = 0
+
+    def prepare(self, record):
+        # Resolve mensagem e traceback na thread de origem; o registro na fila fica autocontido
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            DroppingQueueHandler.dropped += 1
+
+
+def _start_listener(log_queue, log_file):
+    # delay=True: o arquivo só é aberto no primeiro registro
+    file_handler = logging.handlers.RotatingFileHandler(
+        log_file, maxBytes=config.LOG_MAX_BYTES, backupCount=config.LOG_BACKUP_COUNT,
+        encoding='utf-8', delay=True)
+    file_handler.setFormatter(JsonFormatter())
+    console_handler = logging.StreamHandler()
+    console_handler.setFormatter(ContextConsoleFormatter("%(asctime)s [%(levelname)s] %(message)s"))
+    console_handler.setLevel(config.LOG_CONSOLE_LEVEL)
+    listener = logging.handlers.QueueListener(
+        log_queue, file_handler, console_handler, respect_handler_level=True)
+    listener.start()
+    return listener
+
+
+def _set_root_handler(handler):
+    root = logging.getLogger()
+    for h in list(root.handlers):
+        root.removeHandler(h)
+    root.addHandler(handler)
+    root.setLevel(config.LOG_LEVEL)
+    for name, level in config.LOG_LEVELS.items():
+        logging.getLogger(name).setLevel(level)
+
+
+def configure(log_file=None):
+    """
+    Configura o logging do processo (idempotente). log_file troca o arquivo de destino
+    (ex.: config.LOG_FILE_SERVICE); processos filhos são ignorados (ver configure_worker).
+    """
+    global _listener, _log_queue, _log_file
+    with _configure_lock:
+        if _worker or multiprocessing.parent_process() is not None:
+            return
+        if _listener is not None:
+            if log_file is not None and str(log_file) != _log_file:
+                _listener.stop()
+                for h in _listener.handlers:
+                    h.close()
+                _listener = _start_listener(_log_queue, str(log_file))
+                _log_file = str(log_file)
+            return
+        log_file = str(log_file or config.LOG_FILE)
+        _log_queue = queue.Queue(maxsize=config.LOG_QUEUE_SIZE)
+
+        queue_handler = DroppingQueueHandler(_log_queue)
+        queue_handler.addFilter(ContextFilter())
+        queue_handler.addFilter(DebugSamplingFilter(config.LOG_DEBUG_SAMPLE_EVERY))
+        _set_root_handler(queue_handler)
+
+        _listener = _start_listener(_log_queue, log_file)
+        _log_file = log_file
+        atexit.register(shutdown)
+
+
+def configure_worker(log_queue):
+    """
+    Initializer dos processos filhos (ProcessPoolExecutor): nenhum arquivo aberto aqui,
+    os registros vão pela multiprocessing.Queue para o processo pai (worker_logging).
+    """
+    global _listener, _worker
+    with _configure_lock:
+        _worker = True
+        # Com fork o filho herda o listener do pai, mas não a thread dele
+        _listener = None
+        handler = logging.handlers.QueueHandler(log_queue)
+        handler.addFilter(ContextFilter())
+        _set_root_handler(handler)
+
+
+class _ForwardHandler(logging.Handler):
+    """Reinjeta no logging deste processo os registros recebidos dos filhos."""
+
+    def handle(self, record):
+        logging.getLogger(record.name).handle(record)
+        return True
+
+
+@contextmanager
+def worker_logging():
+    """Fila a passar para configure_worker nos processos filhos; o pai grava os registros deles."""
+    log_queue = multiprocessing.Queue()
+    listener = logging.handlers.QueueListener(log_queue, _ForwardHandler())
+    listener.start()
+    try:
+        yield log_queue
+    finally:
+        listener.stop()
+        log_queue.close()
+
+
+def shutdown():
+    """Esvazia a fila e fecha os arquivos de log."""
+    global _listener
+    with _configure_lock:
+        if _listener is None:
+            return
+        _listener.stop()
+        _listener = None
+        if DroppingQueueHandler.dropped:
+            print(f"log_setup: {DroppingQueueHandler.dropped} log records dropped (queue full)")
@@ -4,23 +4,25 @@ import cv2
 import numpy as np
 import zxingcpp
 import re
+import shutil
 from pathlib import Path
 from ultralytics import YOLO
 from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import nullcontext
 import threading
 import json
 import ocr_utils
 import validation
 import config
-
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s [%(levelname)s] %(message)s",
-    handlers=[
-        logging.FileHandler("label_app.log"),
-        logging.StreamHandler()
-    ]
-)
+import log_setup
+import crop_arena
+from model_registry import ModelRegistry
+from micro_batch import MicroBatcher
+import overlay
+import sku_catalog
+import retention
+import profiling
+from scheduler import PipelineCancelled, checkpoint
 
 def load_variants():
     path = config.SKU_VARIANTS_PATH
@@ -44,6 +46,7 @@ def add_variant(sku, field, variant):
         variants[sku][field].append(variant)
         save_variants(variants)
         logging.info(f"Added variant: {sku} - {field} - {variant}")
+        registry.reload({"variants"})
 
 class SafeYOLO:
     def __init__(self, model_path):
@@ -64,6 +67,10 @@ class SafeYOLO:
     def names(self):
         return self.model.names
 
+    def warm_up(self):
+        """Aquece o modelo na thread atual (ex.: a thread fixa do MicroBatcher)."""
+        self._initialize_thread_model()
+
     def predict(self, img):
         try:
             self._initialize_thread_model()
@@ -72,19 +79,36 @@ class SafeYOLO:
             logging.error(f"Prediction error: {e}")
             raise
 
-yolo1 = SafeYOLO(config.YOLO1_MODEL_PATH)
-logging.info("Loaded YOLO1 model")
-yolo2 = SafeYOLO(config.YOLO2_MODEL_PATH)
-logging.info("Loaded YOLO2 model")
+# Modelos com micro-batching; o serviço de inferência troca para INFERENCE_MICRO_BATCH_MODELS
+micro_batch_models = frozenset(config.MICRO_BATCH_MODELS)
+
+def enable_micro_batching(kinds):
+    """Deve ser chamado antes do primeiro load_models() (vale para os modelos carregados depois)."""
+    global micro_batch_models
+    micro_batch_models = frozenset(kinds)
+
+def build_model(path, kind):
+    """SafeYOLO aquecido; com micro-batching se kind estiver em micro_batch_models."""
+    model = SafeYOLO(path)
+    if kind in micro_batch_models:
+        model = MicroBatcher(model, kind)
+    return model
+
+registry = ModelRegistry(build_model)
+
+def load_models():
+    """
+    Retorna o ModelSet ativo (YOLO1, YOLO2, variantes), carregando-o na primeira chamada,
+    e garante o EasyOCR carregado.
+    """
+    models = registry.current()
+    ocr_utils.get_reader()
+    return models
 
 def decode_barcode_ean(image):
     try:
-        success, buf = cv2.imencode('.png', image)
-        if not success:
-            return ""
-        arr = np.frombuffer(buf.tobytes(), dtype=np.uint8)
-        img = cv2.imdecode(arr, cv2.IMREAD_COLOR)
-        barcodes = zxingcpp.read_barcodes(img)
+        # zxing lê o array diretamente; só copia se o recorte não for contíguo
+        barcodes = zxingcpp.read_barcodes(np.ascontiguousarray(image))
         if barcodes:
             raw = barcodes[0].text
             cleaned = re.sub(r"\D", "", raw)
@@ -94,39 +118,119 @@ def decode_barcode_ean(image):
         logging.exception("Barcode decode exception")
         return ""
 
+def order_boxes(boxes, thresh=30):
+    """
+    Ordena as labels em linhas (por y do centro) e, dentro de cada linha, por x.
+    :param boxes: array (N, 4) de x1, y1, x2, y2
+    :return: array (N, 4) na ordem de leitura
+    """
+    boxes = np.asarray(boxes, dtype=np.int64).reshape(-1, 4)
+    if len(boxes) == 0:
+        return boxes
+    cx = (boxes[:, 0] + boxes[:, 2]) // 2
+    cy = (boxes[:, 1] + boxes[:, 3]) // 2
+    by_y = np.lexsort((cx, cy))
+    # Nova linha sempre que o y do centro salta mais que thresh em relação à label anterior
+    rows = np.concatenate(([0], np.cumsum(np.abs(np.diff(cy[by_y])) > thresh)))
+    return boxes[by_y[np.lexsort((cx[by_y], rows))]]
+
+def detect_labels(yolo1, img):
+    """Estágio YOLO1: caixas das labels (x1, y1, x2, y2) já ordenadas."""
+    res1 = yolo1.predict(img)[0]
+    xyxy = res1.boxes.xyxy.cpu().numpy().astype(np.int64)
+    return [tuple(b) for b in order_boxes(xyxy).tolist()]
+
+def detect_fields(yolo2, crop_rot, valid_fields):
+    """Estágio YOLO2: lista de (campo normalizado, (x1, y1, x2, y2)) na label rotacionada."""
+    fields = []
+    for b in yolo2.predict(crop_rot)[0].boxes:
+        cls = int(b.cls[0])
+        norm = yolo2.names[cls].replace("_", " ").upper()
+        if norm not in valid_fields:
+            continue
+        fields.append((norm, tuple(map(int, b.xyxy[0]))))
+    return fields
+
+def read_field(norm, crop_field, bufs, arena_stats=None):
+    """
+    Estágio de leitura (código de barras / OCR) de um campo.
+    :return: (ocr_pre, ocr_text, crop_status), ou None se o recorte for vazio
+    """
+    ocr_size, crop_status = ocr_utils.canonical_crop_size(crop_field.shape, norm)
+    if ocr_size is None:
+        return None
+    if norm == "EAN":
+        decoded = decode_barcode_ean(bufs.field_bgr(crop_field, arena_stats))
+        ocr_pre = decoded if decoded else "-"
+        ocr_text = decoded if decoded else ocr_utils.extract_text_from_image(
+            bufs.field_rgb(crop_field, arena_stats, ocr_size), rgb=True)
+    else:
+        ocr_pre = ocr_utils.extract_text_from_image(
+            bufs.field_rgb(crop_field, arena_stats, ocr_size), rgb=True)
+        ocr_text = ocr_pre
+    return ocr_pre, ocr_text, crop_status
+
+def validate_read(norm, ocr_text, crop_status, expected, sku_variants, sku):
+    """Estágio de validação: heurísticas de OCR + validation.validate_field."""
+    if norm == "EAN":
+        res = validation.validate_field("EAN", ocr_text, expected, sku_variants, sku)
+    else:
+        if norm == "CAPACITY":
+            ocr_pos = validation.fix_capacity_ocr(ocr_text)
+        elif norm == "BASIC MODEL":
+            ocr_pos = validation.fix_basic_model_ocr(ocr_text)
+        elif norm == "COLOR":
+            ocr_pos = validation.fix_color_ocr(ocr_text)
+        else:
+            ocr_pos = ocr_text
+        res = validation.validate_field(norm.title(), ocr_pos, expected, sku_variants, sku)
+    res.crop_status = crop_status
+    return res
+
+# Cópias das imagens originais (modo replay) saem do caminho do resultado: uma thread só
+_archiver = ThreadPoolExecutor(max_workers=1, thread_name_prefix='archive')
+
+def _archive_original(img, image_path, out_dir, base):
+    """Guarda a imagem original em logs/<base>/ para o modo replay, dentro de ARCHIVE_QUOTA_BYTES."""
+    src = Path(image_path)
+    dst = out_dir / f"{base}_original{src.suffix or '.png'}"
+    try:
+        if src.exists():
+            shutil.copyfile(src, dst)
+        else:
+            cv2.imwrite(str(dst), img)
+        retention.enforce_disk_quota(config.BASE_DIR / 'logs', "*/*_original.*", config.ARCHIVE_QUOTA_BYTES)
+    except Exception:
+        logging.exception("Failed archiving original image")
+
 def process_image_pipeline(image_path, sku_info=None, progress_callback=None, stop_event=None, gui_update_fn=None, user_ip=None):
     img = cv2.imread(image_path)
     if img is None:
         raise FileNotFoundError(f"Cannot read {image_path}")
+    return process_loaded_image(img, image_path, sku_info, progress_callback, stop_event, gui_update_fn, user_ip)
 
-    annotated = img.copy()
-    res1 = yolo1.predict(img)[0]
+def process_loaded_image(img, image_path, sku_info=None, progress_callback=None, stop_event=None, gui_update_fn=None, user_ip=None):
+    """Executa o pipeline sobre uma imagem já decodificada; image_path define o diretório de logs."""
+    base = Path(image_path).stem
+    profiler = profiling.ImageProfiler(config.BASE_DIR / 'logs' / base, base)
+    result = None
+    try:
+        profiler.start()
+        with log_setup.log_context(image=base):
+            result = _process_loaded_image(img, image_path, sku_info, progress_callback, stop_event, gui_update_fn, user_ip,
+                                           profiler)
+        return result
+    finally:
+        record = sku_catalog.as_record(sku_info)
+        profiler.finish(sku=record.sku if record else None, label_count=result[1] if result else None)
 
-    boxes_raw = [tuple(map(int, b.xyxy[0])) for b in res1.boxes]
-    if not boxes_raw:
-        boxes = []
-    else:
-        thresh = 30
-        centers = []
-        for i, (x1, y1, x2, y2) in enumerate(boxes_raw):
-            centers.append((i, ((x1 + x2) // 2, (y1 + y2) // 2, x1, y1, x2, y2)))
-        centers_sorted = sorted(centers, key=lambda t: (t[1][1], t[1][0]))
-        rows = []
-        cur_row = []
-        last_y = None
-        for i, (_, y, *_rest) in centers_sorted:
-            if last_y is not None and abs(y - last_y) > thresh:
-                rows.append(cur_row)
-                cur_row = []
-            cur_row.append(i)
-            last_y = y
-        if cur_row: rows.append(cur_row)
-        order_map = []
-        for row in rows:
-            xs = [(idx, (boxes_raw[idx][0]+boxes_raw[idx][2])//2) for idx in row]
-            xs_sorted = sorted(xs, key=lambda t: t[1])
-            order_map.extend([idx for idx, _ in xs_sorted])
-        boxes = [boxes_raw[i] for i in order_map]
+def _process_loaded_image(img, image_path, sku_info, progress_callback, stop_event, gui_update_fn, user_ip,
+                          profiler=None):
+    models = load_models()
+    yolo1, yolo2 = models.yolo1, models.yolo2
+    boxes = detect_labels(yolo1, img)
+    compositor = overlay.OverlayCompositor(img, boxes)
+    checkpoint(stop_event)
     count = len(boxes)
     ng_labels = []
     base = Path(image_path).stem
@@ -135,63 +239,38 @@ def process_image_pipeline(image_path, sku_info=None, progress_callback=None, st
     metrics_path = out_dir / 'metrics.txt'
     if metrics_path.exists():
         metrics_path.unlink()
-    all_label_results = []
-    sku_variants = load_variants()
+    label_results = [None] * count
+    sku_variants = models.variants
+    # sku_info pode ser um SkuRecord do catálogo ou um dict (linha do INI / JSON do serviço)
+    record = sku_catalog.as_record(sku_info)
+    sku = record.sku if record else None
+    arena = crop_arena.get_arena(sku)
+    arena_stats = crop_arena.ArenaStats()
 
-    valid_fields = set()
-    if sku_info:
-        valid_fields = {k.strip().upper() for k in sku_info.keys() if k.strip() and k.upper() != 'SKU'}
+    valid_fields = record.check_fields if record else frozenset()
 
-    def handle_label(idx, coords):
-        if stop_event and stop_event.is_set():
-            return
+    def handle_label(idx, coords, bufs):
+        checkpoint(stop_event)
         x1, y1, x2, y2 = coords
         crop_label = img[y1:y2, x1:x2]
-        crop_rot = cv2.rotate(crop_label, cv2.ROTATE_90_CLOCKWISE)
-        box_color = (255, 0, 0)
-
-        cv2.rectangle(annotated, (x1, y1), (x2, y2), box_color, 2)
-        cv2.putText(annotated, f"{idx+1:02d}", (x1+5, y2-5), cv2.FONT_HERSHEY_SIMPLEX, 0.8, box_color, 2)
-        if gui_update_fn:
-            gui_update_fn(annotated.copy())
+        crop_rot = bufs.label_roi(img, coords, arena_stats)
+        box_color = overlay.COLOR_PENDING
 
         logs = {}
         score_list = []
 
         try:
-            res2 = yolo2.predict(crop_rot)[0].boxes
             fields_detected = {}
-            for b in res2:
-                cls = int(b.cls[0])
-                raw_name = yolo2.names[cls]
-                norm = raw_name.replace("_", " ").upper()
-                if norm not in valid_fields:
-                    continue
-                fx1, fy1, fx2, fy2 = map(int, b.xyxy[0])
+            checkpoint(stop_event)
+            for norm, (fx1, fy1, fx2, fy2) in detect_fields(yolo2, crop_rot, valid_fields):
+                checkpoint(stop_event)
                 crop_field = crop_rot[fy1:fy2, fx1:fx2]
-                expected = sku_info.get(norm, "") if sku_info else ""
-                if not expected and sku_info:
-                    for key in sku_info:
-                        if key.strip().upper() == norm:
-                            expected = sku_info[key]
-                            break
-                ocr_pre, ocr_pos, score, res = "-", "-", 0.0, None
-                if norm == "EAN":
-                    decoded = decode_barcode_ean(crop_field)
-                    ocr_pre = decoded if decoded else "-"
-                    ocr_pos = decoded if decoded else ocr_utils.extract_text_from_image(crop_field)
-                    res = validation.validate_field("EAN", ocr_pos, expected, sku_variants, sku_info["SKU"])
-                else:
-                    ocr_pre = ocr_utils.extract_text_from_image(crop_field)
-                    if norm == "CAPACITY":
-                        ocr_pos = validation.fix_capacity_ocr(ocr_pre)
-                    elif norm == "BASIC MODEL":
-                        ocr_pos = validation.fix_basic_model_ocr(ocr_pre)
-                    elif norm == "COLOR":
-                        ocr_pos = validation.fix_color_ocr(ocr_pre)
-                    else:
-                        ocr_pos = ocr_pre
-                    res = validation.validate_field(norm.title(), ocr_pos, expected, sku_variants, sku_info["SKU"])
+                with log_setup.log_context(field=norm):
+                    read = read_field(norm, crop_field, bufs, arena_stats)
+                    if read is None:
+                        continue
+                    _, ocr_text, crop_status = read
+                    res = validate_read(norm, ocr_text, crop_status, record.expected(norm), sku_variants, sku)
                 score = res.score
                 logs[norm.title()] = res
                 fields_detected[norm.title()] = res
@@ -199,36 +278,62 @@ def process_image_pipeline(image_path, sku_info=None, progress_callback=None, st
 
             mean_score = np.mean(score_list) if score_list else 0
             if mean_score > 0.95:
-                box_color = (0, 255, 0)
+                box_color = overlay.COLOR_OK
             elif any(not v.valid for v in fields_detected.values()):
-                box_color = (0, 0, 255)
+                box_color = overlay.COLOR_NG
 
-            cv2.rectangle(annotated, (x1, y1), (x2, y2), box_color, 2)
-            cv2.putText(annotated, f"{idx+1:02d}", (x1+5, y2-5), cv2.FONT_HERSHEY_SIMPLEX, 0.8, box_color, 2)
-            all_label_results.append(logs)
+            compositor.set_status(idx, box_color)
+            label_results[idx] = logs
             if gui_update_fn:
-                gui_update_fn(annotated.copy())
+                gui_update_fn(compositor.preview())
             ng_fields = [v for v in fields_detected.values() if not v.valid]
             if ng_fields:
                 ng_labels.append({
-                    "crop_img": crop_label,
+                    "crop": retention.get_pool().put(crop_label),
                     "logs": logs,
-                    "sku": sku_info["SKU"],
+                    "sku": sku,
                     "label_num": idx + 1
                 })
             if progress_callback:
                 progress_callback(idx + 1, count)
+        except PipelineCancelled:
+            raise
         except Exception:
             logging.exception("Label task exception on label %d", idx + 1)
 
+    def handle_label_ctx(idx, coords):
+        # Threads do pool não herdam o contexto de log da thread que submeteu; os buffers
+        # são emprestados da arena do SKU, então sobrevivem ao executor desta imagem.
+        # O profiler só amostra as threads registradas, então o worker entra nele aqui.
+        with log_setup.log_context(image=base, sku=sku, label=idx + 1), arena.checkout() as bufs, \
+                (profiler.track() if profiler else nullcontext()):
+            handle_label(idx, coords, bufs)
+
     with ThreadPoolExecutor(max_workers=min(4, count or 1)) as executor:
-        futures = [executor.submit(handle_label, i, boxes[i]) for i in range(count)]
+        futures = [executor.submit(handle_label_ctx, i, boxes[i]) for i in range(count)]
         for fut in as_completed(futures):
             if stop_event and stop_event.is_set():
                 break
-            if fut.exception():
+            if fut.exception() and not isinstance(fut.exception(), PipelineCancelled):
                 logging.exception("Label task exception during parallel execution")
 
+    # Qualquer cancelamento (superseded, deadline, botão Stop ou stop_event simples) descarta o resultado
+    checkpoint(stop_event)
+
+    # Resultados na ordem das labels; labels que falharam ficam de fora, mas o metrics.txt
+    # grava o número real (Label #n = label n da imagem), que o replay usa para comparar
+    label_numbers = [i + 1 for i, logs in enumerate(label_results) if logs is not None]
+    all_label_results = [label_results[n - 1] for n in label_numbers]
+    annotated = compositor.render()
     cv2.imwrite(str(out_dir / f"{base}_annotated.jpg"), annotated)
-    validation.log_metrics(metrics_path, base, all_label_results, user_ip)
-    return annotated, count, ng_labels, all_label_results 
+    if config.ARCHIVE_ORIGINALS:
+        _archiver.submit(_archive_original, img, image_path, out_dir, base)
+    logging.info(f"Crop arena [{base}]: {arena_stats}")
+    logging.info(f"Model version [{base}]: {models.version}")
+    resident = retention.resident_bytes(annotated, ng_labels, all_label_results)
+    logging.info(f"Resident bytes [{base}]: {resident} (NG crop pool: {retention.get_pool().resident_bytes})")
+    validation.log_metrics(metrics_path, base, all_label_results, user_ip, arena_stats=arena_stats,
+                           model_version=models.version, resident_bytes=resident, sku=sku,
+                           label_numbers=label_numbers)
+    return annotated, count, ng_labels, all_label_results
+
@@ -0,0 +1,144 @@
+import logging
+import queue
+import threading
+import time
+from collections import Counter
+
+import config
+
+# Micro-batching na frente de SafeYOLO.predict: chamadas concorrentes (várias estações
+# no serviço de inferência) são agrupadas dentro de uma janela curta e executadas em um
+# único forward em lote. Só vale onde há chamadores concorrentes; na GUI o scheduler
+# processa uma imagem por vez e a janela seria só latência extra.
+
+_STOP = object()
+
+
+class _Request:
+    __slots__ = ('img', 'enqueued', 'done', 'result', 'error')
+
+    def __init__(self, img):
+        self.img = img
+        self.enqueued = time.perf_counter()
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class MicroBatcher:
+    def __init__(self, model, name, window=config.MICRO_BATCH_WINDOW, max_batch=config.MICRO_BATCH_MAX):
+        """
+        :param model: SafeYOLO (predict aceita uma imagem ou uma lista de imagens)
+        """
+        self.model = model
+        self.name = name
+        self.window = window
+        self.max_batch = max_batch
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._closed = False
+        self._stats_lock = threading.Lock()
+        self.batch_sizes = Counter()
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.requests = 0
+        # Thread fixa; o aquecimento do modelo nela acontece aqui, fora do caminho das requisições
+        self._warm = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"microbatch-{name}", daemon=True)
+        self._thread.start()
+        self._warm.wait()
+
+    @property
+    def names(self):
+        return self.model.names
+
+    def predict(self, img):
+        """Mesmo retorno de SafeYOLO.predict para uma imagem: lista com um Results."""
+        req = _Request(img)
+        with self._lock:
+            closed = self._closed
+            if not closed:
+                self._queue.put(req)
+        if closed:
+            # Modelo substituído no hot reload: imagens ainda em andamento chamam direto
+            return self.model.predict(img)
+        req.done.wait()
+        if req.error is not None:
+            raise req.error
+        return [req.result]
+
+    def close(self):
+        """Encerra a thread depois de atender o que já está na fila (chamado no hot reload)."""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._queue.put(_STOP)
+
+    def _collect(self):
+        """Retorna (lote, parar)."""
+        first = self._queue.get()
+        if first is _STOP:
+            return [], True
+        batch = [first]
+        deadline = first.enqueued + self.window
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            try:
+                req = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if req is _STOP:
+                return batch, True
+            batch.append(req)
+        return batch, False
+
+    def _run(self):
+        try:
+            warm_up = getattr(self.model, 'warm_up', None)
+            if warm_up:
+                warm_up()
+        except Exception:
+            logging.exception(f"Micro-batch [{self.name}] warm-up failed")
+        finally:
+            self._warm.set()
+        stop = False
+        while not stop:
+            batch, stop = self._collect()
+            if not batch:
+                continue
+            started = time.perf_counter()
+            try:
+                results = self.model.predict([r.img for r in batch])
+                for r, res in zip(batch, results):
+                    r.result = res
+            except Exception as e:
+                for r in batch:
+                    r.error = e
+            finally:
+                for r in batch:
+                    r.done.set()
+            self._record(batch, started)
+
+    def _record(self, batch, started):
+        waits = [started - r.enqueued for r in batch]
+        with self._stats_lock:
+            self.batch_sizes[len(batch)] += 1
+            self.requests += len(batch)
+            self.total_wait += sum(waits)
+            self.max_wait = max(self.max_wait, max(waits))
+            n_batches = sum(self.batch_sizes.values())
+        if n_batches % config.MICRO_BATCH_LOG_EVERY == 0:
+            logging.info(f"Micro-batch [{self.name}]: {self.stats()}")
+
+    def stats(self):
+        with self._stats_lock:
+            n_batches = sum(self.batch_sizes.values())
+            return {
+                "batches": n_batches,
+                "requests": self.requests,
+                "mean_batch": round(self.requests / n_batches, 2) if n_batches else 0.0,
+                "batch_sizes": dict(sorted(self.batch_sizes.items())),
+                "mean_wait_ms": round(1000 * self.total_wait / self.requests, 2) if self.requests else 0.0,
+                "max_wait_ms": round(1000 * self.max_wait, 2),
+            }
@@ -0,0 +1,201 @@
+import hashlib
+import json
+import logging
+import threading
+from pathlib import Path
+
+from watchdog.events import FileSystemEventHandler
+from watchdog.observers import Observer
+
+import config
+
+# Hot reload dos pesos YOLO, do SKU List.ini e do sku_variants.json.
+# Os modelos novos são carregados e aquecidos em background; a troca do ModelSet é
+# atômica, e cada imagem usa o ModelSet obtido no início do pipeline, então imagens
+# em andamento terminam na versão antiga.
+
+
+def file_version(path):
+    """Hash curto do conteúdo do arquivo (ou '-' se não existir)."""
+    path = Path(path)
+    if not path.exists():
+        return "-"
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()[:10]
+
+
+def _load_variants():
+    """Levanta exceção se o JSON estiver inválido (ex.: meio gravado): o reload mantém o ModelSet atual."""
+    path = config.SKU_VARIANTS_PATH
+    if not path.exists():
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        variants = json.load(f)
+    if not isinstance(variants, dict):
+        raise ValueError("sku_variants.json must contain a JSON object")
+    return variants
+
+
+class ModelSet:
+    """Conjunto imutável de modelos usado por uma imagem do início ao fim."""
+
+    def __init__(self, yolo1, yolo2, variants, versions):
+        self.yolo1 = yolo1
+        self.yolo2 = yolo2
+        self.variants = variants
+        self.versions = versions
+
+    @property
+    def version(self):
+        return " | ".join(f"{k}={v}" for k, v in self.versions.items())
+
+
+class _ReloadHandler(FileSystemEventHandler):
+    def __init__(self, registry):
+        super().__init__()
+        self.registry = registry
+
+    def _touch(self, path):
+        self.registry._file_changed(Path(path))
+
+    def on_created(self, event):
+        if not event.is_directory:
+            self._touch(event.src_path)
+
+    def on_modified(self, event):
+        if not event.is_directory:
+            self._touch(event.src_path)
+
+    def on_moved(self, event):
+        if not event.is_directory:
+            self._touch(event.dest_path)
+
+
+class ModelRegistry:
+    def __init__(self, model_factory):
+        """
+        :param model_factory: callable(path, kind) -> modelo YOLO aquecido; kind é 'yolo1' ou 'yolo2'
+        """
+        self.model_factory = model_factory
+        self._current = None
+        self._lock = threading.Lock()
+        self._reload_lock = threading.Lock()
+        self._pending = set()
+        self._timer = None
+        self._observer = None
+        self._listeners = []
+        self._watched = {
+            Path(config.YOLO1_MODEL_PATH).resolve(): "yolo1",
+            Path(config.YOLO2_MODEL_PATH).resolve(): "yolo2",
+            Path(config.SKU_VARIANTS_PATH).resolve(): "variants",
+            Path(config.TEACHING_INI).resolve(): "sku_list",
+        }
+
+    def current(self):
+        """ModelSet ativo; carrega na primeira chamada."""
+        if self._current is None:
+            with self._reload_lock:
+                if self._current is None:
+                    self._current = self._build({"yolo1", "yolo2", "variants"}, None)
+        return self._current
+
+    def subscribe(self, callback):
+        """callback(kind) é chamado após cada reload ('yolo1', 'yolo2', 'variants', 'sku_list')."""
+        self._listeners.append(callback)
+
+    def _build(self, kinds, old):
+        versions = dict(old.versions) if old else {}
+        yolo1 = old.yolo1 if old else None
+        yolo2 = old.yolo2 if old else None
+        variants = old.variants if old else None
+        if "yolo1" in kinds:
+            yolo1 = self.model_factory(config.YOLO1_MODEL_PATH, "yolo1")
+            versions["yolo1"] = file_version(config.YOLO1_MODEL_PATH)
+            logging.info(f"Loaded YOLO1 model ({versions['yolo1']})")
+        if "yolo2" in kinds:
+            yolo2 = self.model_factory(config.YOLO2_MODEL_PATH, "yolo2")
+            versions["yolo2"] = file_version(config.YOLO2_MODEL_PATH)
+            logging.info(f"Loaded YOLO2 model ({versions['yolo2']})")
+        if "variants" in kinds:
+            variants = _load_variants()
+            versions["variants"] = file_version(config.SKU_VARIANTS_PATH)
+        return ModelSet(yolo1, yolo2, variants, versions)
+
+    def reload(self, kinds):
+        """Recarrega os itens indicados e troca o ModelSet atomicamente."""
+        kinds = set(kinds)
+        model_kinds = kinds & {"yolo1", "yolo2", "variants"}
+        if model_kinds:
+            with self._reload_lock:
+                old = self._current
+                # Se ainda não carregado, a primeira chamada a current() já lerá a versão nova
+                new = self._reload_locked(model_kinds, old) if old is not None else None
+            if new is not None:
+                logging.info(f"Model set swapped: {new.version}")
+        for kind in kinds:
+            for cb in list(self._listeners):
+                try:
+                    cb(kind)
+                except Exception:
+                    logging.exception("Hot reload listener failed")
+
+    def _reload_locked(self, kinds, old):
+        try:
+            new = self._build(kinds, old)
+        except Exception:
+            logging.exception(f"Hot reload failed for {sorted(kinds)}; keeping current models")
+            return None
+        with self._lock:
+            self._current = new
+        if old is not None:
+            for attr in ("yolo1", "yolo2"):
+                replaced = getattr(old, attr)
+                if replaced is not getattr(new, attr) and hasattr(replaced, "close"):
+                    # Ex.: MicroBatcher encerra a thread; imagens em andamento seguem chamando direto
+                    replaced.close()
+        return new
+
+    def _file_changed(self, path):
+        kind = self._watched.get(path.resolve())
+        if kind is None:
+            return
+        with self._lock:
+            self._pending.add(kind)
+            # Debounce: cópias de pesos geram vários eventos de escrita
+            if self._timer:
+                self._timer.cancel()
+            self._timer = threading.Timer(config.HOT_RELOAD_DEBOUNCE, self._flush)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _flush(self):
+        with self._lock:
+            kinds, self._pending = self._pending, set()
+            self._timer = None
+        if kinds:
+            logging.info(f"Hot reload triggered: {sorted(kinds)}")
+            self.reload(kinds)
+
+    def start_watching(self):
+        if self._observer is not None:
+            return
+        handler = _ReloadHandler(self)
+        self._observer = Observer()
+        for folder in {p.parent for p in self._watched}:
+            if folder.exists():
+                self._observer.schedule(handler, str(folder), recursive=False)
+        self._observer.daemon = True
+        self._observer.start()
+
+    def stop_watching(self):
+        if self._observer:
+            self._observer.stop()
+            self._observer.join()
+            self._observer = None
+        with self._lock:
+            if self._timer:
+                self._timer.cancel()
+                self._timer = None
@@ -2,15 +2,29 @@ import easyocr
 import numpy as np
 import re
 import logging
+import threading
 import config
 
-# Inicializa o modelo EasyOCR apontando para o diretório local de modelos (.EasyOCR/model)
-reader = easyocr.Reader(
-    ['pt'],
-    gpu=False,
-    model_storage_directory=str(config.EASYOCR_MODEL_DIR),
-    download_enabled=False
-)
+logger = logging.getLogger(__name__)
+
+# O modelo EasyOCR é carregado sob demanda (get_reader), para que clientes do
+# serviço de inferência não precisem carregar o modelo localmente.
+reader = None
+_reader_lock = threading.Lock()
+
+def get_reader():
+    """Inicializa o EasyOCR apontando para o diretório local de modelos (.EasyOCR/model)."""
+    global reader
+    if reader is None:
+        with _reader_lock:
+            if reader is None:
+                reader = easyocr.Reader(
+                    ['pt'],
+                    gpu=False,
+                    model_storage_directory=str(config.EASYOCR_MODEL_DIR),
+                    download_enabled=False
+                )
+    return reader
 
 def fix_capacity_ocr(text):
     """
@@ -52,19 +66,43 @@ def fix_color_ocr(text):
     """Color: só letras e acentos, em maiúsculo."""
     return re.sub(r'[^A-Za-zÀ-ÿ]', '', text or '').upper()
 
-def extract_text_from_image(img, field_type=None):
+def canonical_crop_size(shape, field):
+    """
+    Calcula o tamanho canônico (w, h) de um recorte de campo antes do OCR.
+    :return: ((w, h), status) com status 'small', 'oversized' ou 'ok'
+    """
+    h, w = shape[:2]
+    target_h = config.FIELD_CANONICAL_HEIGHT.get(field.upper(), config.FIELD_CANONICAL_HEIGHT_DEFAULT)
+    if h <= 0 or w <= 0:
+        return None, 'small'
+    target_w = max(1, int(round(w * target_h / h)))
+    status = 'ok'
+    if h < target_h * config.SMALL_CROP_RATIO:
+        status = 'small'
+    elif h > target_h * config.OVERSIZED_CROP_RATIO:
+        status = 'oversized'
+    if target_w > config.FIELD_MAX_WIDTH:
+        # Mantém a proporção: reduz a altura junto com a largura
+        target_h = max(1, int(round(target_h * config.FIELD_MAX_WIDTH / target_w)))
+        target_w = config.FIELD_MAX_WIDTH
+        if status == 'ok':
+            status = 'oversized'
+    return (target_w, target_h), status
+
+def extract_text_from_image(img, field_type=None, rgb=False):
     """
     Extrai texto de uma imagem usando EasyOCR.
     :param img: numpy array (BGR ou RGB)
     :param field_type: se for 'capacity', aplica fix_capacity_ocr
+    :param rgb: True se img já é RGB contíguo (ex.: buffer da crop_arena), evitando nova cópia
     :return: texto reconhecido (string)
     """
     # EasyOCR espera imagem em RGB
-    if len(img.shape) == 3 and img.shape[2] == 3:
+    if not rgb and len(img.shape) == 3 and img.shape[2] == 3:
         img = img[..., ::-1]  # BGR to RGB
 
-    result = reader.readtext(img, detail=0, paragraph=False)
-    logging.info(f"EasyOCR result: {result}")
+    result = get_reader().readtext(img, detail=0, paragraph=False)
+    logger.debug("EasyOCR result: %s", result)
 
     text = " ".join(result).strip()
     if not text:
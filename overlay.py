@@ -0,0 +1,58 @@
+import threading
+import cv2
+import numpy as np
+
+import config
+
+# Compositor único da anotação: as threads de handle_label só publicam o status de cada
+# label (set_status); o desenho é feito de uma vez em render()/preview(), sobre uma cópia,
+# então não há escrita concorrente num frame compartilhado.
+
+COLOR_PENDING = (255, 0, 0)
+COLOR_OK = (0, 255, 0)
+COLOR_NG = (0, 0, 255)
+
+
+class OverlayCompositor:
+    def __init__(self, base_img, boxes, preview_size=config.PREVIEW_SIZE):
+        self.base = base_img
+        self.boxes = np.asarray(boxes, dtype=np.int64).reshape(-1, 4)
+        self.preview_size = preview_size
+        self._colors = [COLOR_PENDING] * len(self.boxes)
+        self._lock = threading.Lock()
+        self._preview_base = None
+
+    def set_status(self, idx, color):
+        with self._lock:
+            self._colors[idx] = color
+
+    def _snapshot(self):
+        with self._lock:
+            return list(self._colors)
+
+    @staticmethod
+    def _draw(frame, boxes, colors, scale=1.0):
+        thickness = max(1, int(round(2 * scale)))
+        font_scale = 0.8 * scale
+        off = max(1, int(round(5 * scale)))
+        for idx, ((x1, y1, x2, y2), color) in enumerate(zip(boxes.tolist(), colors)):
+            cv2.rectangle(frame, (x1, y1), (x2, y2), color, thickness)
+            cv2.putText(frame, f"{idx+1:02d}", (x1 + off, y2 - off), cv2.FONT_HERSHEY_SIMPLEX,
+                        font_scale, color, thickness)
+        return frame
+
+    def render(self):
+        """Imagem anotada em resolução cheia (uma cópia do frame original)."""
+        return self._draw(self.base.copy(), self.boxes, self._snapshot())
+
+    def preview(self):
+        """Imagem anotada reduzida para a GUI; o frame reduzido é calculado uma única vez."""
+        with self._lock:
+            if self._preview_base is None:
+                self._preview_base = cv2.resize(self.base, self.preview_size, interpolation=cv2.INTER_AREA)
+            colors = list(self._colors)
+        h, w = self.base.shape[:2]
+        pw, ph = self.preview_size
+        scale = np.array([pw / w, ph / h, pw / w, ph / h])
+        boxes = np.rint(self.boxes * scale).astype(np.int64)
+        return self._draw(self._preview_base.copy(), boxes, colors, scale=min(pw / w, ph / h) ** 0.5)
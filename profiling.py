@@ -0,0 +1,158 @@
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
+import config
+import retention
+
+# Profiling opcional do pipeline por imagem.
+# - Captura explícita (config.PROFILE_ENABLED, variável de ambiente ou botão no modo
+#   debug da GUI): amostragem fina das pilhas das threads da imagem.
+# - Captura automática: com PROFILE_SLO_SECONDS definido (por padrão o CYCLE_TIME_DEADLINE),
+#   um amostrador leve roda sempre e o perfil só é gravado se a imagem passar do orçamento.
+# Só entram as threads da própria imagem (a que chamou start() e as que entram em track()),
+# para que no serviço as requisições concorrentes não se misturem no mesmo perfil.
+# Os arquivos ficam em logs/<imagem>/ e o total em disco é limitado por PROFILE_QUOTA_BYTES.
+
+_enabled_override = None
+
+
+def set_enabled(flag):
+    """Liga/desliga a captura explícita em tempo de execução (ex.: botão da GUI)."""
+    global _enabled_override
+    _enabled_override = bool(flag)
+
+
+def is_enabled():
+    if _enabled_override is not None:
+        return _enabled_override
+    if config.PROFILE_ENABLED:
+        return True
+    return os.environ.get(config.PROFILE_ENV_VAR, '').strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+class StackSampler(threading.Thread):
+    """Amostra as pilhas das threads em `threads` a cada intervalo (formato 'collapsed stacks')."""
+
+    def __init__(self, interval, threads):
+        super().__init__(name='profile-sampler', daemon=True)
+        self.interval = interval
+        self.threads = threads
+        self.samples = Counter()
+        self._stop_event = threading.Event()
+
+    def run(self):
+        me = threading.get_ident()
+        names = {}
+        # Rótulo por code object, montado uma vez só: cada amostra só percorre os frames
+        labels = {}
+        while not self._stop_event.wait(self.interval):
+            for ident, frame in sys._current_frames().items():
+                if ident == me or ident not in self.threads:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    label = labels.get(code)
+                    if label is None:
+                        label = labels[code] = (f"{code.co_name} "
+                                                f"({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    stack.append(label)
+                    frame = frame.f_back
+                name = names.get(ident)
+                if name is None:
+                    names = {t.ident: t.name for t in threading.enumerate()}
+                    name = names.setdefault(ident, str(ident))
+                stack.append(name)
+                self.samples[tuple(stack)] += 1
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+class ImageProfiler:
+    def __init__(self, out_dir, base):
+        self.out_dir = Path(out_dir)
+        self.base = base
+        self.explicit = is_enabled()
+        self.budget = config.PROFILE_SLO_SECONDS
+        self._threads = set()
+        self._sampler = None
+        self._start = None
+
+    def start(self):
+        """Inicia a captura na thread atual; se falhar, a imagem segue sem profiling."""
+        self._start = time.perf_counter()
+        if not (self.explicit or self.budget):
+            return self
+        self._threads.add(threading.get_ident())
+        interval = config.PROFILE_SAMPLE_INTERVAL if self.explicit else config.PROFILE_SLO_SAMPLE_INTERVAL
+        try:
+            sampler = StackSampler(interval, self._threads)
+            sampler.start()
+        except Exception:
+            logging.exception("Failed starting pipeline profiler; continuing without profiling")
+            self.explicit = False
+            self.budget = None
+            return self
+        self._sampler = sampler
+        return self
+
+    @contextmanager
+    def track(self):
+        """Inclui a thread atual (ex.: worker de label) nas amostras enquanto o bloco roda."""
+        ident = threading.get_ident()
+        self._threads.add(ident)
+        try:
+            yield
+        finally:
+            self._threads.discard(ident)
+
+    def finish(self, sku=None, label_count=None):
+        if self._start is None:
+            return None
+        elapsed = time.perf_counter() - self._start
+        if self._sampler:
+            self._sampler.stop()
+        over_budget = bool(self.budget) and elapsed > self.budget
+        if not (self.explicit or over_budget):
+            return None
+        trigger = "explicit" if self.explicit else f"slo>{self.budget:.2f}s"
+        try:
+            path = self._write(elapsed, trigger, sku, label_count)
+            enforce_quota()
+        except Exception:
+            logging.exception("Failed writing pipeline profile")
+            return None
+        logging.info(f"Pipeline profile saved ({trigger}, {elapsed:.2f}s): {path}")
+        return path
+
+    def _write(self, elapsed, trigger, sku, label_count):
+        self.out_dir.mkdir(parents=True, exist_ok=True)
+        stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        path = self.out_dir / f"profile_{stamp}.txt"
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(f"Image: {self.base}\n")
+            f.write(f"SKU: {sku}\n")
+            f.write(f"Labels: {label_count}\n")
+            f.write(f"Elapsed: {elapsed:.3f}s\n")
+            f.write(f"Trigger: {trigger}\n")
+            if self._sampler:
+                f.write(f"Samples: {sum(self._sampler.samples.values())} "
+                        f"(interval {self._sampler.interval * 1000:.0f} ms)\n\n")
+                for stack, n in self._sampler.samples.most_common():
+                    f.write(f"{';'.join(reversed(stack))} {n}\n")
+        return path
+
+
+def enforce_quota(root=None, quota=None):
+    """Apaga os perfis mais antigos em logs/*/ até o total caber em PROFILE_QUOTA_BYTES."""
+    retention.enforce_disk_quota(root or config.BASE_DIR / 'logs', "*/profile_*",
+                                 config.PROFILE_QUOTA_BYTES if quota is None else quota)
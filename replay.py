@@ -0,0 +1,281 @@
+import argparse
+import hashlib
+import json
+import logging
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+import cv2
+
+import config
+import crop_arena
+import log_setup
+import main
+import sku_catalog
+from model_registry import file_version
+
+# Modo replay: revalida imagens já processadas (logs/<base>/<base>_original.*) em um
+# pool de processos. Os estágios caros (YOLO1, YOLO2, OCR) ficam em cache em disco,
+# indexados por hash da imagem + hash dos modelos, então uma mudança só em
+# validation.py / variantes roda apenas a validação. Gera um relatório de PASS/FAIL
+# que mudaram em relação ao metrics.txt original.
+
+STAGE_CACHE_VERSION = 1
+IMAGE_EXTS = ('.jpg', '.jpeg', '.png', '.bmp')
+LABEL_LINE = re.compile(r"^Label #(\d+):")
+FIELD_LINE = re.compile(r"^  (?P<field>[^:]+): OCR_Pre=.*\| (?P<status>PASS|FAIL)\b")
+SKU_LINE = re.compile(r"^SKU: (?P<sku>.+)$")
+
+
+def image_hash(path):
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def stage_fingerprint():
+    """Hash de tudo que influencia os estágios em cache: pesos YOLO, modelos OCR e normalização dos recortes."""
+    parts = [STAGE_CACHE_VERSION, file_version(config.YOLO1_MODEL_PATH), file_version(config.YOLO2_MODEL_PATH)]
+    ocr_dir = Path(config.EASYOCR_MODEL_DIR)
+    if ocr_dir.exists():
+        for p in sorted(ocr_dir.iterdir()):
+            st = p.stat()
+            parts.append((p.name, st.st_size, st.st_mtime_ns))
+    parts += [sorted(config.FIELD_CANONICAL_HEIGHT.items()), config.FIELD_CANONICAL_HEIGHT_DEFAULT,
+              config.FIELD_MAX_WIDTH, config.SMALL_CROP_RATIO, config.OVERSIZED_CROP_RATIO]
+    return hashlib.sha1(repr(parts).encode("utf-8")).hexdigest()[:16]
+
+
+class StageCache:
+    def __init__(self, fingerprint, root=config.STAGE_CACHE_DIR):
+        self.dir = Path(root) / fingerprint
+
+    def _path(self, key):
+        return self.dir / f"{key}.json"
+
+    def get(self, key):
+        try:
+            with open(self._path(key), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def put(self, key, stages):
+        self.dir.mkdir(parents=True, exist_ok=True)
+        path = self._path(key)
+        tmp = path.with_suffix(f".{os.getpid()}.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(stages, f, ensure_ascii=False)
+        os.replace(tmp, path)
+
+
+def compute_stages(img, record, models):
+    """Roda YOLO1, YOLO2 e a leitura dos campos; não valida nada."""
+    bufs = crop_arena.CropBuffers()
+    labels = []
+    for idx, coords in enumerate(main.detect_labels(models.yolo1, img)):
+        # Como em handle_label: uma label com erro é registrada e pulada, sem abortar a imagem
+        try:
+            crop_rot = bufs.label_roi(img, coords)
+            fields = []
+            for norm, (fx1, fy1, fx2, fy2) in main.detect_fields(models.yolo2, crop_rot, record.check_fields):
+                read = main.read_field(norm, crop_rot[fy1:fy2, fx1:fx2], bufs)
+                if read is None:
+                    continue
+                ocr_pre, ocr_text, crop_status = read
+                fields.append({"name": norm, "box": [fx1, fy1, fx2, fy2], "ocr_pre": ocr_pre,
+                               "ocr_text": ocr_text, "crop_status": crop_status})
+        except Exception as e:
+            logging.exception("Replay label task exception on label %d", idx + 1)
+            labels.append({"box": list(coords), "fields": None, "error": str(e)})
+            continue
+        labels.append({"box": list(coords), "fields": fields})
+    return {"labels": labels}
+
+
+def validate_stages(stages, record, sku_variants):
+    results = []
+    for label in stages["labels"]:
+        if label["fields"] is None:
+            results.append(None)
+            continue
+        logs = {}
+        try:
+            for fld in label["fields"]:
+                res = main.validate_read(fld["name"], fld["ocr_text"], fld["crop_status"],
+                                         record.expected(fld["name"]), sku_variants, record.sku)
+                logs[fld["name"].title()] = res
+        except Exception:
+            logging.exception("Replay validation exception on label %d", len(results) + 1)
+            logs = None
+        results.append(logs)
+    return results
+
+
+def parse_metrics(metrics_path):
+    """Lê o metrics.txt de produção: (sku, {número da label: {campo: 'PASS'|'FAIL'}})."""
+    sku, labels, current = None, {}, None
+    if not metrics_path.exists():
+        return sku, None
+    with open(metrics_path, encoding="utf-8") as f:
+        for line in f:
+            line = line.rstrip("\n")
+            m = SKU_LINE.match(line)
+            if m:
+                sku = m.group("sku").strip()
+                continue
+            m = LABEL_LINE.match(line)
+            if m:
+                current = labels.setdefault(int(m.group(1)), {})
+                continue
+            m = FIELD_LINE.match(line)
+            if m and current is not None:
+                current[m.group("field")] = m.group("status")
+    return sku, labels
+
+
+def log_dir_for(image_path):
+    image_path = Path(image_path)
+    if image_path.stem.endswith("_original"):
+        return image_path.parent
+    return config.BASE_DIR / 'logs' / image_path.stem
+
+
+def replay_image(image_path, sku=None):
+    """Executado nos processos do pool. Retorna um dict serializável."""
+    image_path = Path(image_path)
+    metrics_sku, previous = parse_metrics(log_dir_for(image_path) / 'metrics.txt')
+    sku = sku or metrics_sku
+    out = {"image": str(image_path), "sku": sku, "cache_hit": False, "previous": previous, "labels": None}
+    record = sku_catalog.get_catalog().get(sku) if sku else None
+    if record is None:
+        out["error"] = f"SKU '{sku}' não encontrado" if sku else "SKU desconhecido (use --sku)"
+        return out
+
+    cache = StageCache(stage_fingerprint())
+    key = hashlib.sha1(f"{image_hash(image_path)}|{sorted(record.check_fields)}".encode("utf-8")).hexdigest()
+    stages = cache.get(key)
+    if stages is None:
+        img = cv2.imread(str(image_path))
+        if img is None:
+            out["error"] = "imagem ilegível"
+            return out
+        stages = compute_stages(img, record, main.load_models())
+        # Falhas por label podem ser transitórias: só entra no cache o resultado completo
+        if all(label["fields"] is not None for label in stages["labels"]):
+            cache.put(key, stages)
+    else:
+        out["cache_hit"] = True
+
+    results = validate_stages(stages, record, main.load_variants())
+    out["labels"] = [
+        {name: {"status": "PASS" if res.valid else "FAIL", "ocr_pos": res.ocr_pos,
+                "expected": res.expected, "score": round(res.score, 3)}
+         for name, res in logs.items()}
+        if logs is not None else None
+        for logs in results
+    ]
+    return out
+
+
+def diff_result(result):
+    """
+    Lista de mudanças (label, campo, antes, depois) em relação ao metrics.txt, casando as
+    labels pelo número (labels que falharam não aparecem no metrics.txt nem aqui).
+    """
+    changes = []
+    previous = result.get("previous")
+    if previous is None or result.get("labels") is None:
+        return changes
+    current = {idx + 1: logs for idx, logs in enumerate(result["labels"]) if logs is not None}
+    for label_num in sorted(set(previous) | set(current)):
+        old = previous.get(label_num, {})
+        new = current.get(label_num, {})
+        for field in sorted(set(old) | set(new)):
+            before = old.get(field, "-")
+            after = new[field]["status"] if field in new else "-"
+            if before != after:
+                changes.append((label_num, field, before, after, new.get(field)))
+    return changes
+
+
+def find_images(paths):
+    images = []
+    for p in map(Path, paths):
+        if p.is_file():
+            images.append(p)
+            continue
+        for f in sorted(p.rglob("*")):
+            if (f.suffix.lower() in IMAGE_EXTS and not f.stem.endswith("_annotated")
+                    and f.parent.name not in ('ng_labels', '.ng_spill')):
+                images.append(f)
+    return images
+
+
+def write_report(results, report_path):
+    totals = {"images": 0, "cache_hits": 0, "errors": 0, "pass_to_fail": 0, "fail_to_pass": 0, "other": 0}
+    lines = []
+    for result in sorted(results, key=lambda r: r["image"]):
+        totals["images"] += 1
+        totals["cache_hits"] += int(result["cache_hit"])
+        if result.get("error"):
+            totals["errors"] += 1
+            lines.append(f"{result['image']}: ERROR {result['error']}")
+            continue
+        changes = diff_result(result)
+        if result.get("previous") is None:
+            lines.append(f"{result['image']}: sem metrics.txt anterior ({len(result['labels'])} labels)")
+        for label_num, field, before, after, new in changes:
+            if (before, after) == ("PASS", "FAIL"):
+                totals["pass_to_fail"] += 1
+            elif (before, after) == ("FAIL", "PASS"):
+                totals["fail_to_pass"] += 1
+            else:
+                totals["other"] += 1
+            detail = f" | OCR_Pos='{new['ocr_pos']}' | Expected='{new['expected']}' | Score={new['score']:.3f}" if new else ""
+            lines.append(f"{result['image']}: Label #{label_num} {field}: {before} -> {after}{detail}")
+    summary = (f"Replay: {totals['images']} images | cache hits: {totals['cache_hits']} | errors: {totals['errors']} | "
+               f"PASS->FAIL: {totals['pass_to_fail']} | FAIL->PASS: {totals['fail_to_pass']} | other: {totals['other']}")
+    report_path = Path(report_path)
+    report_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(report_path, "w", encoding="utf-8") as f:
+        f.write(summary + "\n")
+        for line in lines:
+            f.write(line + "\n")
+    return summary
+
+
+def run(paths, sku=None, workers=config.REPLAY_WORKERS, report_path=None):
+    images = find_images(paths)
+    logging.info(f"Replay: {len(images)} images, {workers} workers")
+    results = []
+    # Os workers não abrem o arquivo de log: os registros deles são gravados por este processo
+    with log_setup.worker_logging() as log_queue, ProcessPoolExecutor(
+            max_workers=workers, initializer=log_setup.configure_worker, initargs=(log_queue,)) as executor:
+        futures = {executor.submit(replay_image, str(p), sku): p for p in images}
+        for fut in as_completed(futures):
+            try:
+                results.append(fut.result())
+            except Exception as e:
+                logging.exception(f"Replay failed for {futures[fut]}")
+                results.append({"image": str(futures[fut]), "cache_hit": False, "error": str(e)})
+    report_path = report_path or config.BASE_DIR / 'logs' / 'replay_report.txt'
+    summary = write_report(results, report_path)
+    logging.info(summary)
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Revalida imagens arquivadas (logs/) com a validação atual")
+    parser.add_argument('paths', nargs='*', default=[str(config.BASE_DIR / 'logs')],
+                        help="imagens ou pastas (padrão: logs/)")
+    parser.add_argument('--sku', help="SKU a usar quando o metrics.txt não tiver a linha SKU")
+    parser.add_argument('--workers', type=int, default=config.REPLAY_WORKERS)
+    parser.add_argument('--report', help="arquivo do relatório (padrão: logs/replay_report.txt)")
+    args = parser.parse_args()
+    log_setup.configure(config.LOG_FILE_REPLAY)
+    run(args.paths, sku=args.sku, workers=args.workers, report_path=args.report)
@@ -0,0 +1,179 @@
+import itertools
+import logging
+import sys
+import threading
+import weakref
+from collections import OrderedDict
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+import config
+
+# Retenção com memória limitada dos recortes NG: cada recorte é copiado (soltando a
+# referência à imagem inteira) para um pool com teto de bytes; quando o teto é
+# atingido, os recortes mais antigos vão para disco em PNG (compressão sem perdas).
+
+
+class CropHandle:
+    """Referência a um recorte NG guardado no CropPool (em memória ou em disco)."""
+
+    __slots__ = ('key', 'shape', 'nbytes', '_pool', '__weakref__')
+
+    def __init__(self, pool, key, shape, nbytes):
+        self._pool = pool
+        self.key = key
+        self.shape = shape
+        self.nbytes = nbytes
+
+    def load(self):
+        return self._pool.load(self.key)
+
+    def release(self):
+        self._pool.drop(self.key)
+
+    @property
+    def resident_bytes(self):
+        return self._pool.resident_bytes_of(self.key)
+
+
+class CropPool:
+    def __init__(self, max_bytes=config.NG_CROP_POOL_BYTES, spill_dir=config.NG_CROP_SPILL_DIR):
+        self.max_bytes = max_bytes
+        self.spill_dir = Path(spill_dir)
+        self._lock = threading.Lock()
+        self._mem = OrderedDict()   # key -> ndarray (mais antigo primeiro)
+        self._spilling = {}         # key -> ndarray sendo gravado em disco
+        self._disk = {}             # key -> Path
+        self._resident = 0
+        self._ids = itertools.count()
+
+    def put(self, crop):
+        crop = np.ascontiguousarray(crop).copy()
+        with self._lock:
+            key = next(self._ids)
+            self._mem[key] = crop
+            self._resident += crop.nbytes
+            victims = self._pick_victims_locked()
+        # PNG e escrita em disco fora do lock: os outros workers não esperam pelo I/O
+        self._spill(victims)
+        handle = CropHandle(self, key, crop.shape, crop.nbytes)
+        weakref.finalize(handle, self.drop, key)
+        return handle
+
+    def _pick_victims_locked(self):
+        victims = []
+        while self._resident > self.max_bytes and len(self._mem) > 1:
+            key, crop = self._mem.popitem(last=False)
+            self._resident -= crop.nbytes
+            # Continua legível por load() enquanto é gravado
+            self._spilling[key] = crop
+            victims.append((key, crop))
+        return victims
+
+    def _spill(self, victims):
+        for key, crop in victims:
+            path = self.spill_dir / f"crop_{key:08d}.png"
+            try:
+                self.spill_dir.mkdir(parents=True, exist_ok=True)
+                ok = cv2.imwrite(str(path), crop)
+            except Exception:
+                logging.exception(f"Failed writing {path}")
+                ok = False
+            with self._lock:
+                wanted = self._spilling.pop(key, None) is not None
+                if ok and wanted:
+                    self._disk[key] = path
+            if not ok:
+                logging.error(f"Failed spilling NG crop to {path}; crop dropped")
+            elif not wanted:
+                # Liberado durante a gravação
+                self._unlink(path)
+
+    def load(self, key):
+        with self._lock:
+            crop = self._mem.get(key)
+            if crop is None:
+                crop = self._spilling.get(key)
+            path = self._disk.get(key)
+        if crop is not None:
+            return crop
+        if path is not None:
+            return cv2.imread(str(path), cv2.IMREAD_UNCHANGED)
+        raise KeyError(f"NG crop {key} was released")
+
+    def drop(self, key):
+        with self._lock:
+            crop = self._mem.pop(key, None)
+            if crop is not None:
+                self._resident -= crop.nbytes
+            self._spilling.pop(key, None)
+            path = self._disk.pop(key, None)
+        if path is not None:
+            self._unlink(path)
+
+    @staticmethod
+    def _unlink(path):
+        try:
+            path.unlink()
+        except OSError:
+            pass
+
+    def resident_bytes_of(self, key):
+        with self._lock:
+            crop = self._mem.get(key)
+            return crop.nbytes if crop is not None else 0
+
+    @property
+    def resident_bytes(self):
+        return self._resident
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = CropPool()
+        return _pool
+
+
+def enforce_disk_quota(root, pattern, quota):
+    """Apaga os arquivos mais antigos de root/pattern até o total caber em quota bytes."""
+    files = []
+    for p in Path(root).glob(pattern):
+        try:
+            st = p.stat()
+        except OSError:
+            continue
+        files.append((st.st_mtime, st.st_size, p))
+    total = sum(size for _, size, _ in files)
+    for _, size, p in sorted(files):
+        if total <= quota:
+            break
+        try:
+            p.unlink()
+            total -= size
+        except OSError:
+            pass
+
+
+def results_bytes(all_label_results):
+    """Tamanho aproximado dos resultados por label (dicts + ValidationResult + strings)."""
+    total = sys.getsizeof(all_label_results)
+    for logs in all_label_results:
+        total += sys.getsizeof(logs)
+        for name, res in logs.items():
+            total += sys.getsizeof(name) + sys.getsizeof(res)
+            total += sum(sys.getsizeof(getattr(res, a, None)) for a in ('ocr_pre', 'ocr_pos', 'expected'))
+    return total
+
+
+def resident_bytes(annotated, ng_labels, all_label_results):
+    """Bytes residentes de uma imagem processada: imagem anotada + recortes NG em memória + resultados."""
+    crops = sum(ng["crop"].resident_bytes for ng in ng_labels)
+    return annotated.nbytes + crops + results_bytes(all_label_results)
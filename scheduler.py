@@ -0,0 +1,186 @@
+import logging
+import threading
+import time
+
+import config
+
+# Agendador por estação: processa uma imagem por vez, sempre a mais nova.
+# Quando chega a imagem da próxima bandeja, a imagem em andamento (e as pendentes)
+# ficam com status 'superseded'; o pipeline percebe isso nos checkpoints entre
+# labels, campos e chamadas de inferência e para cedo.
+
+STATUS_PENDING = 'pending'
+STATUS_RUNNING = 'running'
+STATUS_DONE = 'done'
+STATUS_SUPERSEDED = 'superseded'
+STATUS_CANCELLED = 'cancelled'
+STATUS_FAILED = 'failed'
+
+
+class PipelineCancelled(Exception):
+    def __init__(self, reason):
+        super().__init__(reason)
+        self.reason = reason
+
+
+class JobToken:
+    """
+    Token de cancelamento cooperativo; tem a mesma interface usada do stop_event
+    (is_set / set), então pode ser passado direto para main.process_image_pipeline.
+    """
+
+    def __init__(self, station_stop=None, deadline=None):
+        self.station_stop = station_stop
+        self.deadline = deadline
+        self.reason = None
+        self._event = threading.Event()
+
+    def cancel(self, reason):
+        if self.reason is None:
+            self.reason = reason
+        self._event.set()
+
+    def set(self):
+        self.cancel(STATUS_CANCELLED)
+
+    def is_set(self):
+        if self._event.is_set():
+            return True
+        if self.station_stop is not None and self.station_stop.is_set():
+            self.cancel(STATUS_CANCELLED)
+            return True
+        if config.CANCEL_ON_DEADLINE and self.deadline is not None and time.monotonic() > self.deadline:
+            self.cancel('deadline')
+            return True
+        return False
+
+
+def checkpoint(token):
+    """Ponto de cancelamento: levanta PipelineCancelled se o token/stop_event estiver setado."""
+    if token is not None and token.is_set():
+        raise PipelineCancelled(getattr(token, 'reason', None) or STATUS_CANCELLED)
+
+
+class Job:
+    def __init__(self, path, deadline_s, station_stop):
+        self.path = path
+        self.arrival = time.monotonic()
+        self.deadline = self.arrival + deadline_s if deadline_s else None
+        self.token = JobToken(station_stop, self.deadline)
+        self.status = STATUS_PENDING
+        self.result = None
+        self.error = None
+        self.elapsed = None
+        self.missed_deadline = False
+
+
+class StationScheduler:
+    def __init__(self, run_fn, station_stop=None, deadline=config.CYCLE_TIME_DEADLINE,
+                 supersede=config.SUPERSEDE_OLDER_IMAGES, on_finished=None):
+        """
+        :param run_fn: callable(path, token) -> resultado; deve levantar PipelineCancelled ao ser cancelado
+        :param on_finished: callable(job) chamado ao final de cada imagem (inclusive superseded)
+        """
+        self.run_fn = run_fn
+        self.station_stop = station_stop
+        self.deadline = deadline
+        self.supersede = supersede
+        self.on_finished = on_finished
+        self.counters = {'submitted': 0, 'completed': 0, STATUS_SUPERSEDED: 0, STATUS_CANCELLED: 0,
+                         STATUS_FAILED: 0, 'missed_deadline': 0}
+        self._pending = []
+        self._running = None
+        self._cv = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name='station-scheduler', daemon=True)
+        self._thread.start()
+
+    def submit(self, path):
+        job = Job(path, self.deadline, self.station_stop)
+        dropped = []
+        with self._cv:
+            # O watchdog pode avisar o mesmo arquivo mais de uma vez (created + moved)
+            current = self._pending + ([self._running] if self._running is not None else [])
+            for other in current:
+                if str(other.path) == str(path) and not other.token.is_set():
+                    logging.debug(f"Duplicate image event ignored: {path}")
+                    return other
+            self.counters['submitted'] += 1
+            if self.supersede:
+                dropped, self._pending = self._pending, []
+                if self._running is not None:
+                    self._running.token.cancel(STATUS_SUPERSEDED)
+            self._pending.append(job)
+            self._cv.notify()
+        for old in dropped:
+            self._finish(old, STATUS_SUPERSEDED)
+        return job
+
+    def _next_job(self):
+        with self._cv:
+            while not self._pending:
+                self._cv.wait()
+            # Prioridade para a imagem mais nova
+            job = max(self._pending, key=lambda j: j.arrival)
+            self._pending.remove(job)
+            self._running = job
+            return job
+
+    @staticmethod
+    def _cancel_status(reason):
+        # Só 'superseded' tem contador próprio; deadline, Stop etc. contam como cancelados
+        return STATUS_SUPERSEDED if reason == STATUS_SUPERSEDED else STATUS_CANCELLED
+
+    def _run(self):
+        while True:
+            job = self._next_job()
+            # Uma exceção aqui não pode derrubar a thread: a estação pararia de processar imagens
+            try:
+                self._run_job(job)
+            except Exception:
+                logging.exception(f"Scheduler failed handling {job.path}")
+                with self._cv:
+                    self._running = None
+
+    def _run_job(self, job):
+        if job.token.is_set():
+            with self._cv:
+                self._running = None
+            self._finish(job, self._cancel_status(job.token.reason))
+            return
+        job.status = STATUS_RUNNING
+        start = time.monotonic()
+        try:
+            job.result = self.run_fn(job.path, job.token)
+            status = STATUS_DONE
+        except PipelineCancelled as e:
+            status = self._cancel_status(e.reason)
+        except Exception as e:
+            logging.exception(f"Scheduled image failed: {job.path}")
+            job.error = e
+            status = STATUS_FAILED
+        job.elapsed = time.monotonic() - start
+        with self._cv:
+            self._running = None
+        self._finish(job, status)
+
+    def _finish(self, job, status):
+        job.status = status
+        now = time.monotonic()
+        with self._cv:
+            key = 'completed' if status == STATUS_DONE else status
+            if key not in self.counters:
+                key = STATUS_CANCELLED
+            self.counters[key] += 1
+            if job.deadline is not None and now > job.deadline:
+                job.missed_deadline = True
+                self.counters['missed_deadline'] += 1
+            counters = dict(self.counters)
+        logging.info(f"Image {status}: {job.path}"
+                     + (f" ({job.elapsed:.2f}s)" if job.elapsed is not None else "")
+                     + (" [missed deadline]" if job.missed_deadline else "")
+                     + f" | counters: {counters}")
+        if self.on_finished:
+            try:
+                self.on_finished(job)
+            except Exception:
+                logging.exception("Scheduler on_finished callback failed")
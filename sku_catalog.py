@@ -0,0 +1,158 @@
+import csv
+import logging
+import os
+import pickle
+import threading
+from pathlib import Path
+
+import config
+
+# Catálogo de SKUs (SKU List.ini) independente da GUI: o INI é lido uma vez, com as
+# chaves já normalizadas (strip + upper), e um snapshot binário evita reprocessar o
+# arquivo a cada inicialização enquanto o mtime/tamanho do INI não mudar.
+
+SNAPSHOT_VERSION = 1
+
+
+class SkuRecord:
+    """Registro de um SKU: campos indexados pelo nome normalizado (ex.: 'BASIC MODEL')."""
+
+    __slots__ = ('sku', 'fields', 'check_fields', 'raw')
+
+    def __init__(self, sku, fields, raw):
+        self.sku = sku
+        self.fields = fields
+        # Campos verificados nas labels (tudo exceto a própria coluna SKU)
+        self.check_fields = frozenset(k for k in fields if k and k != 'SKU')
+        self.raw = raw
+
+    @classmethod
+    def from_row(cls, row):
+        raw = {k.strip(): (v or '').strip() for k, v in row.items() if k is not None}
+        fields = {k.upper(): v for k, v in raw.items() if k}
+        return cls(fields.get('SKU', ''), fields, raw)
+
+    def get(self, field, default=''):
+        return self.fields.get(field.strip().upper(), default)
+
+    def expected(self, field):
+        return self.fields.get(field, '')
+
+    def as_dict(self):
+        return dict(self.raw)
+
+    def __getstate__(self):
+        return (self.sku, self.fields, self.raw)
+
+    def __setstate__(self, state):
+        self.__init__(*state)
+
+
+def as_record(sku_info):
+    """Aceita SkuRecord, dict (linha do INI / JSON do serviço) ou None."""
+    if sku_info is None or isinstance(sku_info, SkuRecord):
+        return sku_info
+    return SkuRecord.from_row(sku_info)
+
+
+class SkuCatalog:
+    def __init__(self, ini_path=config.TEACHING_INI, cache_path=config.SKU_CATALOG_CACHE):
+        self.ini_path = Path(ini_path)
+        self.cache_path = Path(cache_path)
+        self._records = {}
+        self._source = None
+        self._lock = threading.Lock()
+        self._listeners = []
+
+    def _source_key(self):
+        st = os.stat(self.ini_path)
+        return (st.st_mtime_ns, st.st_size)
+
+    def _parse(self):
+        records = {}
+        with open(self.ini_path, newline='', encoding='utf-8') as f:
+            reader = csv.DictReader(f, delimiter='\t')
+            for row in reader:
+                rec = SkuRecord.from_row(row)
+                if rec.sku:
+                    records[rec.sku] = rec
+        return records
+
+    def _read_snapshot(self, source):
+        # Snapshot ausente, corrompido ou de outra versão é só um cache miss: volta para o INI
+        try:
+            with open(self.cache_path, 'rb') as f:
+                snap = pickle.load(f)
+        except Exception:
+            return None
+        if not isinstance(snap, dict) or snap.get('version') != SNAPSHOT_VERSION or snap.get('source') != source:
+            return None
+        records = snap.get('records')
+        return records if isinstance(records, dict) else None
+
+    def _write_snapshot(self, source, records):
+        tmp = self.cache_path.with_suffix('.tmp')
+        try:
+            with open(tmp, 'wb') as f:
+                pickle.dump({'version': SNAPSHOT_VERSION, 'source': source, 'records': records},
+                            f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, self.cache_path)
+        except OSError:
+            logging.exception("Failed writing SKU catalog snapshot")
+
+    def load(self):
+        """Carrega o catálogo (snapshot se válido, senão o INI). Retorna True se mudou."""
+        source = self._source_key()
+        with self._lock:
+            if source == self._source:
+                return False
+            records = self._read_snapshot(source)
+            if records is None:
+                records = self._parse()
+                self._write_snapshot(source, records)
+                logging.info(f"SKU catalog parsed: {len(records)} SKUs")
+            self._records = records
+            self._source = source
+        for cb in list(self._listeners):
+            try:
+                cb(self)
+            except Exception:
+                logging.exception("SKU catalog listener failed")
+        return True
+
+    def reload_if_changed(self):
+        try:
+            return self.load()
+        except OSError:
+            logging.exception("Failed reloading SKU List.ini")
+            return False
+
+    def subscribe(self, callback):
+        """callback(catalog) é chamado sempre que o catálogo é (re)carregado com mudanças."""
+        self._listeners.append(callback)
+
+    def get(self, sku):
+        return self._records.get(sku.strip()) if sku else None
+
+    def skus(self):
+        return list(self._records)
+
+    def __contains__(self, sku):
+        return sku in self._records
+
+    def __len__(self):
+        return len(self._records)
+
+
+_catalog = None
+_catalog_lock = threading.Lock()
+
+
+def get_catalog():
+    """Catálogo compartilhado pelo processo (GUI, serviço de inferência, replay)."""
+    global _catalog
+    with _catalog_lock:
+        if _catalog is None:
+            _catalog = SkuCatalog()
+            _catalog.load()
+        return _catalog
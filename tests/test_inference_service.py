@@ -0,0 +1,147 @@
+import threading
+import time
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+for _mod in ("cv2", "ultralytics", "easyocr", "watchdog", "zxingcpp"):
+    pytest.importorskip(_mod)
+
+import cv2
+
+import config
+import inference_service
+import main
+import ocr_utils
+import sku_catalog
+from model_registry import ModelRegistry
+from scheduler import JobToken, PipelineCancelled, STATUS_SUPERSEDED
+
+EXPECTED_MODEL = "SM-A155F/DSN"
+LABEL_BOXES = [[160, 20, 280, 180], [20, 20, 140, 180]]
+FIELD_BOXES = [[10, 10, 90, 40]]
+
+
+class _Xyxy:
+    def __init__(self, boxes):
+        self._arr = np.array(boxes, dtype=np.float32).reshape(-1, 4)
+
+    def cpu(self):
+        return self
+
+    def numpy(self):
+        return self._arr
+
+
+class _Boxes(list):
+    def __init__(self, boxes):
+        super().__init__(SimpleNamespace(cls=[0], xyxy=[b]) for b in boxes)
+        self.xyxy = _Xyxy(boxes)
+
+
+class StubYOLO:
+    """Mesmo formato de retorno do SafeYOLO, com caixas fixas."""
+
+    names = {0: "BASIC_MODEL"}
+    delay = 0.0
+
+    def __init__(self, boxes):
+        self.boxes = boxes
+
+    def predict(self, img):
+        time.sleep(self.delay)
+        imgs = img if isinstance(img, list) else [img]
+        return [SimpleNamespace(boxes=_Boxes(self.boxes)) for _ in imgs]
+
+
+@pytest.fixture
+def service(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "BASE_DIR", tmp_path)
+    monkeypatch.setattr(config, "HOT_RELOAD_ENABLED", False)
+    monkeypatch.setattr(config, "ARCHIVE_ORIGINALS", False)
+    monkeypatch.setattr(main, "registry", ModelRegistry(
+        lambda path, kind: StubYOLO(LABEL_BOXES if kind == "yolo1" else FIELD_BOXES)))
+    monkeypatch.setattr(ocr_utils, "get_reader", lambda: None)
+    monkeypatch.setattr(ocr_utils, "extract_text_from_image",
+                        lambda img, field_type=None, rgb=False: EXPECTED_MODEL)
+
+    ini = tmp_path / "SKU List.ini"
+    ini.write_text(f"SKU\tBasic Model\nSKU-TEST\t{EXPECTED_MODEL}\n", encoding="utf-8")
+    catalog = sku_catalog.SkuCatalog(ini, tmp_path / ".sku_catalog.cache")
+    catalog.load()
+    monkeypatch.setattr(sku_catalog, "_catalog", catalog)
+
+    server = inference_service.serve("127.0.0.1", 0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield inference_service.InferenceClient("127.0.0.1", server.server_address[1], timeout=30)
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.mark.parametrize("send_image", [False, True])
+def test_client_round_trip(service, tmp_path, send_image):
+    img = np.full((200, 300, 3), 255, dtype=np.uint8)
+    path = tmp_path / "img_code_0001.png"
+    cv2.imwrite(str(path), img)
+    record = sku_catalog.get_catalog().get("SKU-TEST")
+
+    assert service.health()
+    annotated, count, ng_labels, all_label_results = service.process_image_pipeline(
+        str(path), record, send_image=send_image)
+
+    assert annotated.shape == img.shape
+    assert count == len(LABEL_BOXES)
+    assert ng_labels == []
+    assert len(all_label_results) == count
+    for logs in all_label_results:
+        assert list(logs) == ["Basic Model"]
+        assert logs["Basic Model"].valid
+        assert logs["Basic Model"].expected == EXPECTED_MODEL
+    assert (tmp_path / "logs" / "img_code_0001" / "metrics.txt").exists()
+
+
+def test_unknown_sku_is_reported(service, tmp_path):
+    path = tmp_path / "img_code_0002.png"
+    cv2.imwrite(str(path), np.zeros((50, 50, 3), dtype=np.uint8))
+    with pytest.raises(RuntimeError, match="NOPE"):
+        service._request("POST", "/process", {"sku": "NOPE", "image_path": str(path)})
+
+
+def test_cancel_is_forwarded_to_service(service, tmp_path, monkeypatch):
+    monkeypatch.setattr(StubYOLO, "delay", 1.0)
+    path = tmp_path / "img_code_0003.png"
+    cv2.imwrite(str(path), np.full((200, 300, 3), 255, dtype=np.uint8))
+    token = JobToken()
+    threading.Timer(0.2, token.cancel, args=(STATUS_SUPERSEDED,)).start()
+
+    started = time.monotonic()
+    with pytest.raises(PipelineCancelled) as exc:
+        service.process_image_pipeline(str(path), sku_catalog.get_catalog().get("SKU-TEST"), stop_event=token)
+    assert exc.value.reason == STATUS_SUPERSEDED
+    # Sem o cancelamento remoto: YOLO1 + YOLO2 (labels em paralelo) levariam ~2 s
+    assert time.monotonic() - started < 1.8
+    assert not (tmp_path / "logs" / "img_code_0003" / "metrics.txt").exists()
+
+
+def test_dispatcher_has_no_barrier():
+    release = threading.Event()
+
+    def handler(request, token=None):
+        if request["slow"]:
+            release.wait(5)
+        return {"ok": True, "name": request["name"]}
+
+    dispatcher = inference_service.JobDispatcher(handler, max_concurrent=2)
+    slow = threading.Thread(target=dispatcher.submit, args=({"slow": True, "name": "slow"},))
+    slow.start()
+    try:
+        started = time.monotonic()
+        assert dispatcher.submit({"slow": False, "name": "fast"}, timeout=2)["name"] == "fast"
+        assert time.monotonic() - started < 1
+    finally:
+        release.set()
+        slow.join()
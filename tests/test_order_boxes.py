@@ -0,0 +1,65 @@
+import numpy as np
+import pytest
+
+for _mod in ("cv2", "ultralytics", "easyocr", "zxingcpp"):
+    pytest.importorskip(_mod)
+
+import main
+
+
+def order_boxes_loop(boxes_raw, thresh=30):
+    """Implementação original (laço em Python), usada como referência."""
+    if not boxes_raw:
+        return []
+    centers = []
+    for i, (x1, y1, x2, y2) in enumerate(boxes_raw):
+        centers.append((i, ((x1 + x2) // 2, (y1 + y2) // 2, x1, y1, x2, y2)))
+    centers_sorted = sorted(centers, key=lambda t: (t[1][1], t[1][0]))
+    rows = []
+    cur_row = []
+    last_y = None
+    for i, (_, y, *_rest) in centers_sorted:
+        if last_y is not None and abs(y - last_y) > thresh:
+            rows.append(cur_row)
+            cur_row = []
+        cur_row.append(i)
+        last_y = y
+    if cur_row:
+        rows.append(cur_row)
+    order_map = []
+    for row in rows:
+        xs = [(idx, (boxes_raw[idx][0] + boxes_raw[idx][2]) // 2) for idx in row]
+        xs_sorted = sorted(xs, key=lambda t: t[1])
+        order_map.extend([idx for idx, _ in xs_sorted])
+    return [boxes_raw[i] for i in order_map]
+
+
+def random_boxes(rng, n, span):
+    x1 = rng.integers(0, span, n)
+    y1 = rng.integers(0, span, n)
+    w = rng.integers(1, 60, n)
+    h = rng.integers(1, 60, n)
+    return np.stack([x1, y1, x1 + w, y1 + h], axis=1).tolist()
+
+
+@pytest.mark.parametrize("seed", range(50))
+def test_matches_loop_on_random_boxes(seed):
+    rng = np.random.default_rng(seed)
+    # Área pequena para forçar centros repetidos e linhas coladas no limiar
+    boxes = random_boxes(rng, int(rng.integers(1, 40)), span=int(rng.choice([80, 300, 2000])))
+    assert main.order_boxes(boxes).tolist() == order_boxes_loop(boxes)
+
+
+def test_rows_exactly_thresh_apart():
+    # Centros y: 100, 130 (= thresh, mesma linha), 161 (> thresh, nova linha), 191 (= thresh)
+    boxes = [[200, 90, 220, 110], [0, 120, 20, 140], [100, 151, 120, 171], [10, 181, 30, 201],
+             [50, 90, 70, 110]]
+    expected = order_boxes_loop(boxes)
+    assert main.order_boxes(boxes).tolist() == expected
+    assert expected == [[0, 120, 20, 140], [50, 90, 70, 110], [200, 90, 220, 110],
+                        [10, 181, 30, 201], [100, 151, 120, 171]]
+
+
+def test_empty_input():
+    assert main.order_boxes([]).shape == (0, 4)
+    assert order_boxes_loop([]) == []
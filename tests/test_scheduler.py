@@ -0,0 +1,101 @@
+import threading
+import time
+
+import config
+from scheduler import (StationScheduler, checkpoint, STATUS_CANCELLED, STATUS_DONE,
+                       STATUS_SUPERSEDED)
+
+
+class Recorder:
+    """on_finished que guarda os jobs e permite esperar por um path."""
+
+    def __init__(self):
+        self.jobs = {}
+        self._cv = threading.Condition()
+
+    def __call__(self, job):
+        with self._cv:
+            self.jobs[job.path] = job
+            self._cv.notify_all()
+
+    def wait(self, path, timeout=5):
+        with self._cv:
+            assert self._cv.wait_for(lambda: path in self.jobs, timeout), f"{path} never finished"
+            return self.jobs[path]
+
+
+def run_until_cancelled(release):
+    """run_fn que fica em checkpoints até ser cancelado ou liberado."""
+    def run(path, token):
+        while not release.is_set():
+            checkpoint(token)
+            time.sleep(0.01)
+        return path
+    return run
+
+
+def test_newer_image_supersedes_running_one():
+    release = threading.Event()
+    done = Recorder()
+    sched = StationScheduler(run_until_cancelled(release), deadline=None, supersede=True, on_finished=done)
+
+    sched.submit("a.png")
+    time.sleep(0.05)
+    sched.submit("b.png")
+    assert done.wait("a.png").status == STATUS_SUPERSEDED
+    release.set()
+    assert done.wait("b.png").status == STATUS_DONE
+    assert sched.counters["submitted"] == 2
+    assert sched.counters[STATUS_SUPERSEDED] == 1
+    assert sched.counters["completed"] == 1
+
+
+def test_deadline_counts_as_cancelled_and_keeps_thread_alive(monkeypatch):
+    monkeypatch.setattr(config, "CANCEL_ON_DEADLINE", True)
+    release = threading.Event()
+    done = Recorder()
+    sched = StationScheduler(run_until_cancelled(release), deadline=0.1, supersede=False, on_finished=done)
+
+    # Estoura o prazo rodando
+    job = done.wait(sched.submit("slow.png").path)
+    assert job.status == STATUS_CANCELLED
+    assert job.token.reason == "deadline"
+    assert job.missed_deadline
+
+    # Estoura o prazo ainda na fila, atrás de uma imagem lenta
+    blocker = threading.Event()
+    sched.run_fn = lambda path, token: blocker.wait(5) if path == "busy.png" else path
+    sched.submit("busy.png")
+    time.sleep(0.05)
+    sched.submit("queued.png")
+    time.sleep(0.2)
+    blocker.set()
+    assert done.wait("queued.png").status == STATUS_CANCELLED
+
+    # A thread do agendador continua viva
+    release.set()
+    assert done.wait(sched.submit("next.png").path).status == STATUS_DONE
+    assert sched._thread.is_alive()
+    assert sched.counters[STATUS_CANCELLED] == 2
+    assert sched.counters["missed_deadline"] >= 2
+
+
+def test_duplicate_path_is_ignored_while_pending_or_running():
+    release = threading.Event()
+    done = Recorder()
+    sched = StationScheduler(run_until_cancelled(release), deadline=None, supersede=True, on_finished=done)
+
+    first = sched.submit("same.png")
+    time.sleep(0.05)
+    assert sched.submit("same.png") is first
+    release.set()
+    assert done.wait("same.png").status == STATUS_DONE
+    assert sched.counters["submitted"] == 1
+    assert sched.counters["completed"] == 1
+    assert sched.counters[STATUS_SUPERSEDED] == 0
+
+    # Depois de terminar, o mesmo arquivo pode ser reprocessado
+    del done.jobs["same.png"]
+    assert sched.submit("same.png") is not first
+    assert done.wait("same.png").status == STATUS_DONE
+    assert sched.counters["submitted"] == 2
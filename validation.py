@@ -35,20 +35,42 @@ def add_variant(sku, field, value):
         save_variants(variants)
 
 class ValidationResult:
+    __slots__ = ('valid', 'conf', 'ocr_pre', 'ocr_pos', 'expected', 'score', 'variant_matched', 'crop_status')
+
     def __init__(self, valid, conf, ocr_pre, ocr_pos, expected, score, variant_matched=None):
-        self.valid = valid      # Boolean
-        self.conf = conf        # Similarity/confidence
+        self.valid = bool(valid)  # Boolean
+        self.conf = float(conf)   # Similarity/confidence
         self.ocr_pre = ocr_pre  # Before heuristics
         self.ocr_pos = ocr_pos  # After heuristics
         self.expected = expected
-        self.score = score      # Ratio score
+        self.score = float(score)  # Ratio score
         self.variant_matched = variant_matched
+        self.crop_status = None  # 'small' | 'oversized' | 'ok' (normalização do recorte)
 
     def __str__(self):
         status = "PASS" if self.valid else "FAIL"
         variant_info = f"(VARIANT: {self.variant_matched})" if self.variant_matched else ""
         return f"OCR_Pre='{self.ocr_pre}' | OCR_Pos='{self.ocr_pos}' | Expected='{self.expected}' | Score={self.score:.3f} | {status} {variant_info}"
 
+    def to_dict(self):
+        return {
+            "valid": bool(self.valid),
+            "conf": float(self.conf),
+            "ocr_pre": self.ocr_pre,
+            "ocr_pos": self.ocr_pos,
+            "expected": self.expected,
+            "score": float(self.score),
+            "variant_matched": self.variant_matched,
+            "crop_status": self.crop_status,
+        }
+
+    @classmethod
+    def from_dict(cls, d):
+        res = cls(d["valid"], d["conf"], d["ocr_pre"], d["ocr_pos"], d["expected"], d["score"],
+                  variant_matched=d.get("variant_matched"))
+        res.crop_status = d.get("crop_status")
+        return res
+
 def fix_capacity_ocr(text):
     if not text: return text
     t = ' '.join(text.split())
@@ -157,17 +179,26 @@ def validate_field(field, ocr, expected, sku_variants=None, sku=None):
 
     return ValidationResult(valid, max_score, ocr_pre, ocr_pos, exp, max_score, variant_matched=variant_matched)
 
-def log_metrics(metrics_path, base, all_label_results, user_ip="N/A"):
-    """Salva o arquivo metrics.txt formatado, extendido com logs por campo."""
+def log_metrics(metrics_path, base, all_label_results, user_ip="N/A", arena_stats=None, model_version=None,
+                resident_bytes=None, sku=None, label_numbers=None):
+    """
+    Salva o arquivo metrics.txt formatado, extendido com logs por campo.
+    label_numbers: número de cada label na imagem (padrão 1..N), para não renumerar quando alguma falhou.
+    """
     total_labels = len(all_label_results)
     total_fails = 0
     crops_pequenos = 0
+    crops_grandes = 0
     n_fields = 0
     with open(metrics_path, "w", encoding="utf-8") as f:
         f.write(f"==== {base} ====\n")
         f.write(f"UserIP: {user_ip}\n")
+        if sku:
+            f.write(f"SKU: {sku}\n")
+        if model_version:
+            f.write(f"ModelVersion: {model_version}\n")
         for idx, label in enumerate(all_label_results):
-            f.write(f"Label #{idx+1}:\n")
+            f.write(f"Label #{label_numbers[idx] if label_numbers else idx + 1}:\n")
             for fld, res in label.items():
                 variant_info = f"(VARIANT: {res.variant_matched})" if hasattr(res, "variant_matched") and res.variant_matched else ""
                 f.write(
@@ -176,10 +207,20 @@ def log_metrics(metrics_path, base, all_label_results, user_ip="N/A"):
                 )
                 if not getattr(res, 'valid', False):
                     total_fails += 1
+                crop_status = getattr(res, 'crop_status', None)
+                if crop_status == 'small':
+                    crops_pequenos += 1
+                elif crop_status == 'oversized':
+                    crops_grandes += 1
                 n_fields = max(n_fields, len(label))
         if total_labels > 0 and n_fields > 0:
             fail_rate = 100 * total_fails / (total_labels * n_fields)
             f.write(f"Summary: Total Labels: {total_labels} | Total fails: {total_fails} | Fail rate: {fail_rate:.1f}%\n")
             f.write(f"Crops pequenos: {crops_pequenos}/{total_labels*n_fields}\n")
+            f.write(f"Crops grandes: {crops_grandes}/{total_labels*n_fields}\n")
         else:
             f.write("Summary: No labels detected.\n")
+        if arena_stats is not None:
+            f.write(f"Crop arena: {arena_stats}\n")
+        if resident_bytes is not None:
+            f.write(f"Resident bytes: {resident_bytes}\n")